@@ -1,19 +1,43 @@
-from flask import Flask, request, jsonify
-from firebase_admin import auth
+from flask import Flask, Response, request, jsonify, stream_with_context
+from firebase_admin import firestore
 from functools import wraps
 from flask_cors import CORS
 from flasgger import Swagger
 from datetime import datetime
-import pytz
+import os
+import json
+import uuid
+import time
+import fcntl
+import logging
+import tempfile
+import threading
 
 from database.dbsetup import load_firebase_local, load_firebase_app
-from utils.llms.prompts import get_spotify_client, get_spotify_recs, query_mood_mentor
+from database import summary
+from database.trends import get_trends, trend_series, GRANULARITIES
+from database.profiles import get_profile, set_profile, get_timezone, local_now
+from database.queries import query_journals, stream_journals, get_journals_by_id, MAX_PAGE_SIZE
+from database import imports
+from database.pending import recover_pending
+from utils.llms.prompts import get_spotify_client, get_spotify_recs, choose_genres, query_mood_mentor, stream_mood_mentor, GENRE_PROMPT_VERSION, MENTOR_PROMPT_VERSION
+from utils.llms.prompts import genres_prompt, mood_mentor_prompt
+from utils.llms.memo import memo_key, memoize, cached, remember
 from utils.llms.query import make_client
+from utils.llms.structured import StructuredOutputError
+from utils.llms.context import journal_context, summarize_journal
 from utils.ml.query_api_bert import analyze_journal
+from utils.ml.journal_index import journal_index, JOURNAL_INDEX_ENABLED
+from utils.tokens import verify_token
+from utils.work_queue import WorkQueue
+from utils.singleflight import SingleFlight
+from utils.export import ndjson_chunks, json_array_chunks, gzip_chunks
+from utils import metrics
 
 # === Setup ===
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "https://vibetrackr.netlify.app"]}}, supports_credentials=True)
+CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "https://vibetrackr.netlify.app"]}}, supports_credentials=True, expose_headers=["X-Next-Cursor"])
 #CORS(app, supports_credentials=True)
 
 
@@ -34,6 +58,39 @@ db = load_firebase_app()
 spotify = get_spotify_client()
 gai = make_client()
 
+#async mode: journals are saved with analysis "pending" and a background worker patches the result in
+ASYNC_ANALYSIS = os.environ.get("ASYNC_ANALYSIS", "0") == "1"
+analysis_queue = WorkQueue(workers=int(os.environ.get("ANALYSIS_WORKERS", 4)),
+                           retries=int(os.environ.get("ANALYSIS_RETRIES", 3)),
+                           backoff=float(os.environ.get("ANALYSIS_BACKOFF", 2)),
+                           name="analysis")
+
+#bulk imports run in the background and resume from their last committed chunk when retried
+import_queue = WorkQueue(workers=int(os.environ.get("IMPORT_WORKERS", 2)),
+                         retries=int(os.environ.get("IMPORT_RETRIES", 2)),
+                         backoff=float(os.environ.get("IMPORT_BACKOFF", 5)),
+                         name="import")
+
+#identical concurrent requests (same route, user and journal state) share one computation
+inflight = SingleFlight()
+
+# === Metrics ===
+#route histograms + a per-request trace that the spans in utils/database helpers append to
+#streamed responses (exports, sse) are timed until the response starts, not until the last chunk
+@app.before_request
+def start_request_metrics():
+    request.metrics_start = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_request(route, request.method, response.status_code,
+                           time.perf_counter() - request.metrics_start)
+    return response
+
+
 # === Firebase Auth Decorator ===
 def verify_firebase_token(f):
     @wraps(f)
@@ -43,7 +100,8 @@ def verify_firebase_token(f):
             return jsonify({'error': 'Unauthorized'}), 401
         id_token = auth_header.split('Bearer ')[1]
         try:
-            decoded_token = auth.verify_id_token(id_token) #essentially get id token from bearer 
+            with metrics.span("auth.verify_token"):
+                decoded_token = verify_token(id_token) #essentially get id token from bearer (cached until exp)
             request.user = decoded_token
         except Exception as e:
             return jsonify({'error': 'Invalid token', 'details': str(e)}), 401
@@ -51,6 +109,210 @@ def verify_firebase_token(f):
     return decorated
 
 
+# === Background Analysis ===
+#short extractive summary kept on long journals, prompts use it in place of older entries
+def add_content_summary(journal_data, update=False):
+    content_summary = summarize_journal(journal_data.get("content"))
+    if content_summary:
+        journal_data["content_summary"] = content_summary
+    elif update:
+        journal_data["content_summary"] = firestore.DELETE_FIELD
+
+
+def use_async_analysis():
+    return request.args.get('async', '1' if ASYNC_ANALYSIS else '0') == '1'
+
+
+def run_analysis(uid, journal_id, content, job_id):
+    journal_analysis = analyze_journal(content)
+    journal_ref = db.collection('users').document(uid).collection('journals').document(journal_id)
+    summary.set_journal_analysis(db, uid, journal_ref, job_id, journal_analysis)
+
+
+#called once retries are exhausted and the job is in the dead-letter list
+def fail_analysis(error, uid, journal_id, content, job_id):
+    journal_ref = db.collection('users').document(uid).collection('journals').document(journal_id)
+    summary.set_journal_analysis(db, uid, journal_ref, job_id, 'failed')
+
+
+def queue_analysis(uid, journal_id, content, job_id):
+    analysis_queue.submit(run_analysis, uid, journal_id, content, job_id, on_failure=fail_analysis)
+
+
+#jobs queued by an instance that restarted or scaled down are picked up again (database/pending.py)
+#started by the server (gunicorn.conf.py post_worker_init / __main__ below), not on import. every
+#worker runs the thread but only the one holding a lock file on this host scans, when that worker
+#exits the lock is released and the next worker to wake up takes over
+def start_pending_sweep(interval=None):
+    interval = interval if interval is not None else float(os.environ.get("PENDING_SWEEP_INTERVAL", 300))
+    if interval <= 0:
+        return
+    lock_path = os.environ.get("PENDING_SWEEP_LOCK", os.path.join(tempfile.gettempdir(), "vibetrackr-pending-sweep.lock"))
+    lock_file = open(lock_path, "a")
+
+    def holds_lock():
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB) #no-op once this process holds it
+            return True
+        except OSError:
+            return False
+
+    def sweep():
+        while True:
+            time.sleep(interval)
+            if not holds_lock():
+                continue
+            try:
+                recovered = recover_pending(db, queue_analysis)
+                if recovered:
+                    logger.info("Re-queued %d stale pending analyses", recovered)
+            except Exception as e:
+                logger.warning("Pending analysis sweep failed: %s", e)
+
+    threading.Thread(target=sweep, name="pending-sweep", daemon=True).start()
+
+
+def run_import(db, uid, job_id, entries, timezone, run_id=None):
+    if not imports.run_import(db, uid, job_id, entries, timezone, run_id):
+        return
+    unindex_user(uid)
+
+
+# === Journal Index ===
+#local vector index for /search-journals and /days-like-today (utils/ml/journal_index.py)
+#writes keep an existing shard in step (version is the summary text_version the write produced)
+#a shard that fails to update is dropped, one that missed writes is rebuilt on next use
+def index_journal(uid, journal_id, journal, version=None):
+    if not JOURNAL_INDEX_ENABLED:
+        return
+    try:
+        with metrics.span("index.upsert"):
+            journal_index.upsert(uid, journal_id, journal, version)
+    except Exception as e:
+        logger.warning("Journal index update failed for %s, dropping shard: %s", uid, e)
+        journal_index.drop(uid)
+
+
+def unindex_journal(uid, journal_id, version=None):
+    if not JOURNAL_INDEX_ENABLED:
+        return
+    try:
+        with metrics.span("index.delete"):
+            journal_index.delete(uid, journal_id, version)
+    except Exception as e:
+        logger.warning("Journal index delete failed for %s, dropping shard: %s", uid, e)
+        journal_index.drop(uid)
+
+
+def unindex_user(uid):
+    if JOURNAL_INDEX_ENABLED:
+        journal_index.drop(uid)
+
+
+#build this host's shard from firestore the first time a user searches, or again when the user's
+#journals were written through another instance since (the summary's text_version moved on)
+def ensure_index(uid, user_summary=None):
+    with metrics.span("index.ensure"):
+        if user_summary is None:
+            user_summary = summary.get_summary(db, uid)
+        journal_index.ensure(uid, lambda: stream_journals(db, uid), user_summary.get('text_version', 0))
+
+
+#full journals for (id, score) hits, best first
+def journal_hits(uid, hits):
+    scores = dict(hits)
+    journals = get_journals_by_id(db, uid, [journal_id for journal_id, _ in hits])
+    return [{**journal_view(journal), 'score': scores[journal['id']]} for journal in journals]
+
+
+# === Recommendations ===
+def spot_recs(uid, user_summary):
+    latest_entries = summary.get_recent_journals(db, uid, user_summary)
+    journals_str = journal_context(latest_entries)
+
+    genres = memoize(memo_key("genres", GENRE_PROMPT_VERSION, genres_prompt(journals_str)),
+                     lambda: choose_genres(journals_str, gai))
+    return get_spotify_recs(journals_str, gai, spotify, genres=genres)
+
+
+def mood_mentor(uid, user_summary):
+    latest_entries = summary.get_recent_journals(db, uid, user_summary)
+    journals_str = journal_context(latest_entries)
+
+    return memoize(memo_key("mood_mentor", MENTOR_PROMPT_VERSION, mood_mentor_prompt(journals_str)),
+                   lambda: query_mood_mentor(journals_str, gai))
+
+
+# === Request Parsing ===
+#json array body, or one json object per line for ndjson uploads
+def parse_import_body():
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'text/plain'):
+        try:
+            return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError as e:
+            raise ValueError(f'Invalid NDJSON: {e}')
+
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list):
+        raise ValueError('Body must be a JSON array of journals or NDJSON')
+    return entries
+
+
+def parse_date(value, name):
+    if value is None:
+        return None
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must be YYYY-MM-DD')
+    return value
+
+
+#limit / before / after / start_date / end_date query args for the journal queries
+def journal_page_args():
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if before and after:
+        raise ValueError('Use only one of before / after')
+
+    return {
+        'limit': limit,
+        'before': before,
+        'after': after,
+        'start_date': parse_date(request.args.get('start_date'), 'start_date'),
+        'end_date': parse_date(request.args.get('end_date'), 'end_date'),
+    }
+
+
+#journals as returned to clients: pending / failed analyses go out as analysis null + analysisStatus
+#instead of the bare string, and the background job bookkeeping stays internal
+def journal_view(journal):
+    journal = {k: v for k, v in journal.items() if k not in ('analysis_job', 'analysis_queued_at')}
+    if not isinstance(journal.get('analysis'), dict):
+        journal['analysisStatus'] = journal.get('analysis') or 'pending'
+        journal['analysis'] = None
+    return journal
+
+
+#stream journals out as ndjson or a json array, gzipped when the client accepts it
+def export_response(journals, fmt):
+    chunks = ndjson_chunks(journals) if fmt == 'ndjson' else json_array_chunks(journals)
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+
+    #parsed like werkzeug does: gzip;q=0 turns it off, x-gzip alone doesn't turn it on, * does
+    use_gzip = request.args.get('gzip', '1' if request.accept_encodings['gzip'] > 0 else '0') == '1'
+    headers = {'Vary': 'Accept-Encoding'}
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
 # === Routes ===
 
 @app.route('/')
@@ -96,18 +358,20 @@ def create_user():
     timezone = data.get('timezone')["timeZone"]
     uid = request.user['uid']
 
-    db.collection('users').document(uid).set({
+    set_profile(db, uid, {
         'name': name,
         'email': email,
         'timezone':timezone
     })
 
+    timestamp, date = local_now(timezone)
     db.collection('users').document(uid).collection('journals').document('init_journal').set({
         'title': 'Placeholder to instantiate collection.',
         'content':"placeholder journal",
-        'timestamp':int(datetime.now(pytz.timezone(timezone)).timestamp()),
-        'date':datetime.now(pytz.timezone(timezone)).strftime('%Y-%m-%d')
+        'timestamp':timestamp,
+        'date':date
     })
+    summary.init_summary(db, uid)
 
     return jsonify({'message': 'User created'}), 201
 
@@ -151,16 +415,13 @@ def get_user():
         description: User not found
     """
     uid = request.user['uid']
-    user_ref = db.collection('users').document(uid)
-    user_doc = user_ref.get()
-    if not user_doc.exists:
+    user_data = get_profile(db, uid)
+    if user_data is None:
         return jsonify({'error': 'User not found'}), 404
 
-    journals = user_ref.collection('journals').stream()
-    journal_list = [{**j.to_dict(), 'id': j.id} for j in journals if j.id != "init_journal"]
+    journal_list, _ = query_journals(db, uid)
 
-    user_data = user_doc.to_dict()
-    user_data['journals'] = journal_list
+    user_data['journals'] = [journal_view(j) for j in journal_list]
     return jsonify(user_data), 200
 
 
@@ -175,6 +436,11 @@ def add_journal():
     security:
       - Bearer: []
     parameters:
+      - in: query
+        name: async
+        type: string
+        required: false
+        description: "1 to save immediately with analysis pending and analyze in the background (defaults to ASYNC_ANALYSIS)"
       - in: body
         name: body
         required: true
@@ -204,17 +470,29 @@ def add_journal():
         description: Unauthorized
     """
     uid = request.user['uid']
-    timezone = db.collection('users').document(uid).get().to_dict()["timezone"]
+    timezone = get_timezone(db, uid)
 
     journal_data = request.json
+    run_async = use_async_analysis()
 
-    journal_analysis = analyze_journal(journal_data.get("content"))
-    journal_data["analysis"] = journal_analysis
-    journal_data["timestamp"] = int(datetime.now(pytz.timezone(timezone)).timestamp())
-    journal_data["date"] = datetime.now(pytz.timezone(timezone)).strftime('%Y-%m-%d')
+    if run_async:
+        job_id = uuid.uuid4().hex
+        journal_data["analysis"] = "pending"
+        journal_data["analysis_job"] = job_id
+        journal_data["analysis_queued_at"] = time.time()
+    else:
+        journal_analysis = analyze_journal(journal_data.get("content"))
+        journal_data["analysis"] = journal_analysis
+    journal_data["timestamp"], journal_data["date"] = local_now(timezone)
+    add_content_summary(journal_data)
 
     journal_ref = db.collection('users').document(uid).collection('journals').document()
-    journal_ref.set(journal_data)
+    text_version = summary.add_journal_entry(db, uid, journal_ref, journal_data)
+    index_journal(uid, journal_ref.id, journal_data, text_version)
+
+    if run_async:
+        queue_analysis(uid, journal_ref.id, journal_data.get("content"), job_id)
+        return jsonify({'message': 'Journal added', 'journalId': journal_ref.id, 'analysis': 'pending'}), 201
     return jsonify({'message': 'Journal added', 'journalId': journal_ref.id}), 201
 
 
@@ -222,15 +500,46 @@ def add_journal():
 @verify_firebase_token
 def get_journals():
     """
-    Get all journals for the authenticated user.
+    Get the authenticated user's journals, newest first.
     ---
     tags:
       - Journals
     security:
       - Bearer: []
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Page size (max 500). All journals are returned when omitted.
+      - in: query
+        name: before
+        type: string
+        required: false
+        description: Journal ID cursor, return entries older than it
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Journal ID cursor, return entries newer than it
+      - in: query
+        name: start_date
+        type: string
+        required: false
+        description: Earliest date to include (YYYY-MM-DD)
+      - in: query
+        name: end_date
+        type: string
+        required: false
+        description: Latest date to include (YYYY-MM-DD)
+      - in: query
+        name: stream
+        type: string
+        required: false
+        description: "1 to stream the array as journals are read (no X-Next-Cursor)"
     responses:
       200:
-        description: List of journals
+        description: List of journals. X-Next-Cursor holds the cursor for the next page when there may be more.
         schema:
           type: array
           items:
@@ -244,14 +553,203 @@ def get_journals():
                 type: string
               analysis:
                 type: object
+                description: null while the analysis is pending or after it failed
+              analysisStatus:
+                type: string
+                enum: [pending, failed]
+                description: Only present when analysis is null
+      400:
+        description: Invalid paging parameters
       401:
         description: Unauthorized
     """
     uid = request.user['uid']
-    journal_ref = db.collection('users').document(uid).collection('journals')
-    journal_docs = journal_ref.stream()
-    journals = [{**doc.to_dict(), 'id': doc.id} for doc in journal_docs if doc.id != "init_journal"]
-    return jsonify(journals), 200
+    try:
+        page = journal_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if request.args.get('stream') == '1':
+            return export_response(map(journal_view, stream_journals(db, uid, **page)), 'json')
+        journals, next_cursor = query_journals(db, uid, **page)
+    except KeyError:
+        return jsonify({'error': 'Cursor journal not found'}), 400
+
+    response = jsonify([journal_view(j) for j in journals])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
+@app.route('/export-journals', methods=['GET'])
+@verify_firebase_token
+def export_journals():
+    """
+    Stream all of the authenticated user's journals, newest first.
+    ---
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [ndjson, json]
+        required: false
+        description: One journal per line (default) or a single JSON array
+      - in: query
+        name: gzip
+        type: string
+        required: false
+        description: "1/0 to force gzip on/off (default follows Accept-Encoding)"
+      - in: query
+        name: start_date
+        type: string
+        required: false
+        description: Earliest date to include (YYYY-MM-DD)
+      - in: query
+        name: end_date
+        type: string
+        required: false
+        description: Latest date to include (YYYY-MM-DD)
+    responses:
+      200:
+        description: Chunked journal export
+      400:
+        description: Invalid parameters
+      401:
+        description: Unauthorized
+    """
+    uid = request.user['uid']
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return jsonify({'error': 'format must be ndjson or json'}), 400
+    try:
+        page = journal_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        journals = stream_journals(db, uid, **page)
+    except KeyError:
+        return jsonify({'error': 'Cursor journal not found'}), 400
+    return export_response(map(journal_view, journals), fmt)
+
+
+@app.route('/import-journals', methods=['POST'])
+@verify_firebase_token
+def import_journals():
+    """
+    Bulk import journals (eg from another journaling app).
+    ---
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    consumes:
+      - application/json
+      - application/x-ndjson
+    parameters:
+      - in: query
+        name: job_id
+        type: string
+        required: false
+        description: Resume a failed import by posting the same entries again with its job_id (a queued or running one is returned as is, unless it has made no progress for IMPORT_LEASE seconds)
+      - in: body
+        name: body
+        required: true
+        description: JSON array (or NDJSON lines) of journals with content, and optional title, date (YYYY-MM-DD) and timestamp
+        schema:
+          type: array
+          items:
+            type: object
+            required:
+              - content
+            properties:
+              title:
+                type: string
+              content:
+                type: string
+              date:
+                type: string
+                example: "2024-03-02"
+              timestamp:
+                type: integer
+    responses:
+      202:
+        description: Import queued (or already queued / running for this job_id), poll /import-status with the returned jobId
+      200:
+        description: Import with this job_id already finished
+      400:
+        description: Invalid body
+      401:
+        description: Unauthorized
+      409:
+        description: job_id does not match the posted entries
+    """
+    uid = request.user['uid']
+    try:
+        entries = parse_import_body()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job_id = request.args.get('job_id')
+    job = imports.get_job(db, uid, job_id) if job_id else None
+    if job_id and job is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    if job is not None:
+        if job['total'] != len(entries):
+            return jsonify({'error': 'Posted entries do not match this import job'}), 409
+        if job['status'] == 'done':
+            return jsonify({'jobId': job_id, **job}), 200
+        #a queued / running job is still in flight (until its lease runs out), a second run_import
+        #would race it on processed
+        resumed = imports.resume_job(db, uid, job_id)
+        if resumed is None:
+            return jsonify({'jobId': job_id, **(imports.get_job(db, uid, job_id) or job)}), 202
+        job = resumed
+    else:
+        job_id = uuid.uuid4().hex
+        job = imports.create_job(db, uid, job_id, len(entries))
+
+    import_queue.submit(run_import, db, uid, job_id, entries, get_timezone(db, uid), job['run'],
+                        on_failure=imports.fail_import)
+    return jsonify({'jobId': job_id, **job}), 202
+
+
+@app.route('/import-status', methods=['GET'])
+@verify_firebase_token
+def import_status():
+    """
+    Progress of a bulk journal import.
+    ---
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: job_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Job status (queued / running / done / failed) with total, processed, imported, failed and errors
+      401:
+        description: Unauthorized
+      404:
+        description: Import job not found
+    """
+    job_id = request.args.get('job_id')
+    if not job_id:
+        return jsonify({'error': 'Missing job_id'}), 400
+
+    job = imports.get_job(db, request.user['uid'], job_id)
+    if job is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify({'jobId': job_id, **job}), 200
 
 
 @app.route('/delete-journal', methods=['DELETE'])
@@ -284,10 +782,11 @@ def delete_journal():
 
     uid = request.user['uid']
     journal_ref = db.collection('users').document(uid).collection('journals').document(journal_id)
-    if not journal_ref.get().exists:
+    text_version = summary.delete_journal_entry(db, uid, journal_ref)
+    if not text_version:
         return jsonify({'error': 'Journal not found'}), 404
+    unindex_journal(uid, journal_id, text_version)
 
-    journal_ref.delete()
     return jsonify({'message': 'Journal deleted'}), 200
 
 
@@ -307,6 +806,11 @@ def update_journal():
         type: string
         required: true
         description: ID of the journal to update
+      - in: query
+        name: async
+        type: string
+        required: false
+        description: "1 to save immediately with analysis pending and analyze in the background (defaults to ASYNC_ANALYSIS)"
       - in: body
         name: body
         required: true
@@ -332,19 +836,37 @@ def update_journal():
         return jsonify({'error': 'Missing journal_id'}), 400
 
     uid = request.user['uid']
-    timezone = db.collection('users').document(uid).get().to_dict()["timezone"]
+    timezone = get_timezone(db, uid)
     journal_data = request.json
     journal_ref = db.collection('users').document(uid).collection('journals').document(journal_id)
 
     if not journal_ref.get().exists:
         return jsonify({'error': 'Journal not found'}), 404
 
-    journal_analysis = analyze_journal(journal_data.get("content"))
-    journal_data["analysis"] = journal_analysis
-    journal_data["timestamp"] = int(datetime.now(pytz.timezone(timezone)).timestamp())
-    journal_data["date"] = datetime.now(pytz.timezone(timezone)).strftime('%Y-%m-%d')
+    run_async = use_async_analysis()
+
+    if run_async:
+        job_id = uuid.uuid4().hex
+        journal_data["analysis"] = "pending"
+        journal_data["analysis_job"] = job_id
+        journal_data["analysis_queued_at"] = time.time()
+    else:
+        journal_analysis = analyze_journal(journal_data.get("content"))
+        journal_data["analysis"] = journal_analysis
+        journal_data["analysis_job"] = firestore.DELETE_FIELD #stale queued jobs must not overwrite this
+        journal_data["analysis_queued_at"] = firestore.DELETE_FIELD
+    journal_data["timestamp"], journal_data["date"] = local_now(timezone)
+    if "content" in journal_data:
+        add_content_summary(journal_data, update=True)
+
+    text_version = summary.update_journal_entry(db, uid, journal_ref, journal_data)
+    if not text_version:
+        return jsonify({'error': 'Journal not found'}), 404
+    index_journal(uid, journal_id, journal_data, text_version)
 
-    journal_ref.update(journal_data)
+    if run_async:
+        queue_analysis(uid, journal_id, journal_data.get("content"), job_id)
+        return jsonify({'message': 'Journal updated', 'analysis': 'pending'}), 200
     return jsonify({'message': 'Journal updated'}), 200
 
 
@@ -380,12 +902,10 @@ def add_todays_journal():
                       example: 1
     """
     uid = request.user['uid']
-    timezone = db.collection('users').document(uid).get().to_dict()["timezone"]
-    journals = db.collection('users').document(uid).collection('journals').stream()
-    journal_list = [{**j.to_dict(), 'id': j.id} for j in journals if j.id != "init_journal"]
-    latest_entry = sorted(journal_list, key=lambda x: x["timestamp"], reverse=True)[0]["date"]
+    timezone = get_timezone(db, uid)
+    latest_entry = summary.get_summary(db, uid)["last_date"]
 
-    if latest_entry == datetime.now(pytz.timezone(timezone)).strftime('%Y-%m-%d'):
+    if latest_entry == local_now(timezone)[1]:
         return jsonify({"add":0})
     else:
         return jsonify({"add":1}), 200
@@ -428,15 +948,17 @@ def get_spot_recs():
                         type: string
                         example: "https://open.spotify.com/track/abc123"
                   nullable: true
+      502:
+        description: The AI reply could not be used, even after re-asking
     """
     uid = request.user['uid']
-    journals = db.collection('users').document(uid).collection('journals').stream()
-    journal_list = [{**j.to_dict(), 'id': j.id} for j in journals if j.id != "init_journal"]
+    user_summary = summary.get_summary(db, uid)
 
-    latest_entries = sorted(journal_list, key=lambda x: x["timestamp"], reverse=True)[:5]
-    journals_str = "\n\n".join(j.get("content", "") for j in latest_entries)
-
-    tracks = get_spotify_recs(journals_str, gai, spotify)
+    try:
+        tracks = inflight.do(('get-spot-recs', uid, user_summary['version']),
+                             lambda: spot_recs(uid, user_summary))
+    except StructuredOutputError as e:
+        return jsonify({'error': f'Could not read the genre suggestions: {e}'}), 502
 
     return jsonify({'recs': tracks}), 200
 
@@ -467,19 +989,345 @@ def get_mood_mentor():
                   type: string
                   example: "Remember, it's okay to feel overwhelmed sometimes — take a deep breath."
                   nullable: true
+      502:
+        description: The AI reply could not be used, even after re-asking
     """
     uid = request.user['uid']
-    journals = db.collection('users').document(uid).collection('journals').stream()
-    journal_list = [{**j.to_dict(), 'id': j.id} for j in journals if j.id != "init_journal"]
-
-    latest_entries = sorted(journal_list, key=lambda x: x["timestamp"], reverse=True)[:5]
-    journals_str = "\n\n".join(j.get("content", "") for j in latest_entries)
+    user_summary = summary.get_summary(db, uid)
 
-    mentor = query_mood_mentor(journals_str, gai)
+    try:
+        mentor = inflight.do(('get-mood-mentor', uid, user_summary['version']),
+                             lambda: mood_mentor(uid, user_summary))
+    except StructuredOutputError as e:
+        return jsonify({'error': f'Could not read the mood mentor reply: {e}'}), 502
 
     return jsonify({'mentor': mentor}), 200
 
 
+@app.route('/get-summary', methods=['GET'])
+@verify_firebase_token
+def get_summary():
+    """
+    Get the user's running journal statistics.
+    ---
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: Journal count, latest date, mean VAD scores, emotion counts and the latest entries
+        schema:
+          type: object
+          properties:
+            count:
+              type: integer
+            analyzed:
+              type: integer
+            last_date:
+              type: string
+            means:
+              type: object
+            emotions:
+              type: object
+            recent:
+              type: array
+              items:
+                type: object
+      401:
+        description: Unauthorized
+    """
+    uid = request.user['uid']
+    return jsonify(summary.summary_stats(summary.get_summary(db, uid))), 200
+
+
+@app.route('/mood-trends', methods=['GET'])
+@verify_firebase_token
+def mood_trends():
+    """
+    Mood rollups for charts, bucketed by day, week or month in the user's timezone.
+    ---
+    tags:
+      - Summary
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: granularity
+        type: string
+        enum: [day, week, month]
+        required: false
+        description: Bucket size (default day)
+      - in: query
+        name: start
+        type: string
+        required: false
+        description: First bucket to include (YYYY-MM-DD, YYYY-Www or YYYY-MM to match granularity)
+      - in: query
+        name: end
+        type: string
+        required: false
+        description: Last bucket to include
+    responses:
+      200:
+        description: Columnar series, every list lines up with keys
+        schema:
+          type: object
+          properties:
+            granularity:
+              type: string
+            keys:
+              type: array
+              items:
+                type: string
+            count:
+              type: array
+              items:
+                type: integer
+            means:
+              type: object
+              description: V, A, D and Valence_Scaled_By_Mag means per bucket
+            emotions:
+              type: object
+              description: Emotion -> count per bucket
+      400:
+        description: Invalid granularity
+      401:
+        description: Unauthorized
+    """
+    uid = request.user['uid']
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    trends = get_trends(db, uid)
+    return jsonify(trend_series(trends, granularity, request.args.get('start'), request.args.get('end'))), 200
+
+
+@app.route('/stream-mood-mentor', methods=['GET'])
+@verify_firebase_token
+def stream_mood_mentor_route():
+    """
+    Stream mood mentor suggestions as server-sent events.
+    ---
+    tags:
+      - Mood Mentor
+    summary: Same suggestions as /get-mood-mentor, sent one issue at a time as they are generated.
+    description: |
+      Emits an `issue` event per issue object (data is the JSON object, same shape as the items
+      returned by /get-mood-mentor), then a `done` event. An `error` event is sent if generation fails.
+    security:
+      - Bearer: []
+    produces:
+      - text/event-stream
+    responses:
+      200:
+        description: text/event-stream of issue events
+      401:
+        description: Unauthorized
+    """
+    uid = request.user['uid']
+    latest_entries = summary.get_recent_journals(db, uid)
+    journals_str = journal_context(latest_entries)
+    key = memo_key("mood_mentor", MENTOR_PROMPT_VERSION, mood_mentor_prompt(journals_str))
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def events():
+        issues = cached(key)
+        if issues is not None:
+            for issue in issues:
+                yield sse('issue', issue)
+            yield sse('done', {'cached': True})
+            return
+
+        issues = []
+        try:
+            for issue in stream_mood_mentor(journals_str, gai):
+                issues.append(issue)
+                yield sse('issue', issue)
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+            return
+        remember(key, issues)
+        yield sse('done', {'cached': False})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/search-journals', methods=['GET'])
+@verify_firebase_token
+def search_journals():
+    """
+    Search the authenticated user's journals by shared words and phrases, best match first.
+    ---
+    description: |
+      Matching is by keyword overlap (hashed words and word pairs), so "run" does not find "jog".
+      Deployments with EMBED_BACKEND=transformer match by meaning instead.
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Text to search for
+      - in: query
+        name: k
+        type: integer
+        required: false
+        description: Number of results (default 10, max 50)
+      - in: query
+        name: start_date
+        type: string
+        required: false
+        description: Earliest date to include (YYYY-MM-DD)
+      - in: query
+        name: end_date
+        type: string
+        required: false
+        description: Latest date to include (YYYY-MM-DD)
+    responses:
+      200:
+        description: Matching journals, each with a similarity score
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              id:
+                type: string
+              title:
+                type: string
+              content:
+                type: string
+              score:
+                type: number
+      400:
+        description: Invalid parameters
+      401:
+        description: Unauthorized
+      503:
+        description: Journal index disabled
+    """
+    if not JOURNAL_INDEX_ENABLED:
+        return jsonify({'error': 'Journal search is disabled'}), 503
+
+    uid = request.user['uid']
+    query = (request.args.get('q') or '').strip()
+    k = request.args.get('k', 10, type=int)
+    if not query:
+        return jsonify({'error': 'Missing q'}), 400
+    if not 1 <= k <= 50:
+        return jsonify({'error': 'k must be between 1 and 50'}), 400
+    try:
+        start_date = parse_date(request.args.get('start_date'), 'start_date')
+        end_date = parse_date(request.args.get('end_date'), 'end_date')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    ensure_index(uid)
+    with metrics.span("index.search"):
+        hits = journal_index.search(uid, query, k=k, start_date=start_date, end_date=end_date)
+    return jsonify(journal_hits(uid, hits)), 200
+
+
+@app.route('/days-like-today', methods=['GET'])
+@verify_firebase_token
+def days_like_today():
+    """
+    Past journals most similar to one entry (by default the latest one).
+    ---
+    tags:
+      - Journals
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: journal_id
+        type: string
+        required: false
+        description: Journal to compare against (defaults to the most recent entry)
+      - in: query
+        name: k
+        type: integer
+        required: false
+        description: Number of results (default 5, max 50)
+    responses:
+      200:
+        description: The journal compared against and its most similar past entries
+        schema:
+          type: object
+          properties:
+            journalId:
+              type: string
+            similar:
+              type: array
+              items:
+                type: object
+      400:
+        description: Invalid parameters
+      401:
+        description: Unauthorized
+      503:
+        description: Journal index disabled
+    """
+    if not JOURNAL_INDEX_ENABLED:
+        return jsonify({'error': 'Journal search is disabled'}), 503
+
+    uid = request.user['uid']
+    k = request.args.get('k', 5, type=int)
+    if not 1 <= k <= 50:
+        return jsonify({'error': 'k must be between 1 and 50'}), 400
+
+    user_summary = summary.get_summary(db, uid)
+    journal_id = request.args.get('journal_id')
+    if not journal_id:
+        recent = user_summary['recent']
+        if not recent:
+            return jsonify({'journalId': None, 'similar': []}), 200
+        journal_id = recent[0]['id']
+
+    ensure_index(uid, user_summary)
+    with metrics.span("index.search"):
+        hits = journal_index.similar(uid, journal_id, k=k)
+    return jsonify({'journalId': journal_id, 'similar': journal_hits(uid, hits)}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Prometheus metrics for this worker process.
+    ---
+    tags:
+      - Monitoring
+    summary: Per-route and per-stage latency histograms in the Prometheus text format.
+    description: The bearer token is the shared METRICS_TOKEN scrape secret, not a Firebase token. Returns 404 while METRICS_TOKEN is unset.
+    security:
+      - Bearer: []
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Prometheus text exposition (version 0.0.4)
+      401:
+        description: Missing or wrong scrape token
+      404:
+        description: Metrics endpoint disabled (METRICS_TOKEN unset)
+    """
+    if not metrics.METRICS_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not metrics.scrape_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # === Run locally ===
+#production: gunicorn -c gunicorn.conf.py app:app
 if __name__ == '__main__':
-    app.run(debug=False)
+    start_pending_sweep()
+    app.run(debug=False, threaded=True)
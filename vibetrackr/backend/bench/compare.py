@@ -0,0 +1,70 @@
+import sys
+import json
+import argparse
+
+
+#compare two bench.run result files (eg two commits), flagging regressions past the threshold
+#exits 1 when anything regressed so it can gate a ci job
+#   python -m bench.compare bench/results/abc123.json bench/results/def456.json --threshold 0.1
+
+ENDPOINT_METRICS = [('p50_ms', False), ('p95_ms', False), ('p99_ms', False), ('rps', True)]
+
+
+def change(old, new, higher_is_better):
+    if not old or new is None:
+        return None
+    delta = (new - old) / old
+    return delta if higher_is_better else -delta
+
+
+def compare(old, new, threshold):
+    rows, regressions = [], []
+
+    for name in sorted(set(old.get('endpoints', {})) & set(new.get('endpoints', {}))):
+        for metric, higher_is_better in ENDPOINT_METRICS:
+            a, b = old['endpoints'][name].get(metric), new['endpoints'][name].get(metric)
+            delta = change(a, b, higher_is_better)
+            rows.append((f"{name} {metric}", a, b, delta))
+            if delta is not None and delta < -threshold:
+                regressions.append(rows[-1])
+
+    for name in sorted(set(old.get('micro', {})) & set(new.get('micro', {}))):
+        a, b = old['micro'][name]['us_per_op'], new['micro'][name]['us_per_op']
+        delta = change(a, b, False)
+        rows.append((f"{name} us/op", a, b, delta))
+        if delta is not None and delta < -threshold:
+            regressions.append(rows[-1])
+
+    return rows, regressions
+
+
+def fmt(value):
+    return f"{value:12.2f}" if value is not None else f"{'-':>12s}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed fractional slowdown")
+    args = parser.parse_args(argv)
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{'':36s} {old['meta'].get('commit') or 'old':>12s} {new['meta'].get('commit') or 'new':>12s}   change")
+    rows, regressions = compare(old, new, args.threshold)
+    for label, a, b, delta in rows:
+        mark = "  REGRESSED" if delta is not None and delta < -args.threshold else ""
+        change_str = f"{delta * 100:+7.1f}%" if delta is not None else "      -"
+        print(f"{label:36s} {fmt(a)} {fmt(b)}  {change_str}{mark}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold * 100:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,491 @@
+import time
+import copy
+import json
+import uuid
+import random
+import hashlib
+import threading
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+
+#local stand-ins for every external service app.py talks to (firestore, the vad model, spotify,
+#gemini), each with configurable latency + error rate so the routes can be benchmarked offline
+
+
+class FakeServiceError(RuntimeError):
+    pass
+
+
+#latency (ms, gaussian jitter) + random failures for one fake service
+class Latency:
+
+    def __init__(self, mean_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return max(0.0, self._random.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+    def _maybe_fail(self, name):
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise FakeServiceError(f"injected {name} failure")
+
+    def wait(self, name="service"):
+        time.sleep(self._delay())
+        self._maybe_fail(name)
+
+
+# === Firestore ===
+
+def _split(path):
+    parts = path.split("/")
+    return "/".join(parts[:-1]), parts[-1]
+
+
+def _apply_update(data, changes):
+    for key, value in changes.items():
+        if value is firestore.DELETE_FIELD:
+            data.pop(key, None)
+        else:
+            data[key] = copy.deepcopy(value)
+    return data
+
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        if self._data is None or field not in self._data:
+            raise KeyError(field)
+        return copy.deepcopy(self._data[field])
+
+
+class FakeDocumentReference:
+
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollectionReference(self._db, f"{self.path}/{name}")
+
+    def _get(self):
+        return FakeSnapshot(self, self._db._read(self.path))
+
+    def get(self, transaction=None):
+        if transaction is None:
+            self._db.latency.wait("firestore")
+        return self._get()
+
+    def set(self, data, merge=False):
+        self._db.latency.wait("firestore")
+        self._db._write(self.path, data, merge=merge)
+
+    def create(self, data):
+        self._db.latency.wait("firestore")
+        with self._db._lock:
+            if self._db._read(self.path) is not None:
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            self._db._write(self.path, data)
+
+    def update(self, data, option=None):
+        self._db.latency.wait("firestore")
+        self._db._update(self.path, data)
+
+    def delete(self):
+        self._db.latency.wait("firestore")
+        self._db._delete(self.path)
+
+
+class FakeQuery:
+
+    def __init__(self, db, path=None, group=None, filters=(), orders=(), limit=None, start=None, end=None):
+        self._db = db
+        self._path = path
+        self._group = group
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start = start #(cursor, inclusive)
+        self._end = end
+
+    def _copy(self, **changes):
+        fields = dict(path=self._path, group=self._group, filters=self._filters, orders=self._orders,
+                      limit=self._limit, start=self._start, end=self._end)
+        fields.update(changes)
+        return FakeQuery(self._db, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    #cursors are a snapshot or a list of order_by values (document references for __name__)
+    def start_at(self, document_fields):
+        return self._copy(start=(document_fields, True))
+
+    def start_after(self, document_fields):
+        return self._copy(start=(document_fields, False))
+
+    def end_at(self, document_fields):
+        return self._copy(end=(document_fields, True))
+
+    def end_before(self, document_fields):
+        return self._copy(end=(document_fields, False))
+
+    def _matches(self, data):
+        ops = {"==": lambda a, b: a == b, "!=": lambda a, b: a != b, "<": lambda a, b: a < b,
+               "<=": lambda a, b: a <= b, ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+               "in": lambda a, b: a in b}
+        for field, op, value in self._filters:
+            if field not in data or not ops[op](data[field], value):
+                return False
+        return all(field in data for field, _ in self._orders if field != "__name__")
+
+    #explicit orders plus the implicit trailing document name order firestore adds
+    def _effective_orders(self):
+        if any(field == "__name__" for field, _ in self._orders):
+            return self._orders
+        last_direction = self._orders[-1][1] if self._orders else "ASCENDING"
+        return self._orders + [("__name__", last_direction)]
+
+    @staticmethod
+    def _value(path, data, field):
+        return path if field == "__name__" else data[field]
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, FakeSnapshot):
+            data = cursor.to_dict() or {}
+            return [self._value(cursor.reference.path, data, field) for field, _ in orders]
+        return [getattr(value, "path", value) for value in cursor]
+
+    #-1 / 0 / 1: the doc sorts before / level with / after the cursor (cursor may be a prefix)
+    def _compare(self, path, data, values, orders):
+        for (field, direction), b in zip(orders, values):
+            a = self._value(path, data, field)
+            if a != b:
+                before = a < b
+                if direction == "DESCENDING":
+                    before = not before
+                return -1 if before else 1
+        return 0
+
+    def _run(self):
+        docs = [(path, data) for path, data in self._db._scan(self._path, self._group) if self._matches(data)]
+        orders = self._effective_orders()
+
+        #stable multi-key sort, last key first
+        for field, direction in reversed(orders):
+            docs.sort(key=lambda d: self._value(d[0], d[1], field), reverse=direction == "DESCENDING")
+
+        if self._start is not None:
+            values = self._cursor_values(self._start[0], orders)
+            lowest = 0 if self._start[1] else 1
+            docs = [(path, data) for path, data in docs if self._compare(path, data, values, orders) >= lowest]
+        if self._end is not None:
+            values = self._cursor_values(self._end[0], orders)
+            highest = 0 if self._end[1] else -1
+            docs = [(path, data) for path, data in docs if self._compare(path, data, values, orders) <= highest]
+
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return [FakeSnapshot(FakeDocumentReference(self._db, path), copy.deepcopy(data)) for path, data in docs]
+
+    def stream(self, transaction=None):
+        if transaction is None:
+            self._db.latency.wait("firestore")
+        yield from self._run()
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    #contiguous partitions by document name (like CollectionGroup.get_partitions)
+    def get_partitions(self, partition_count):
+        docs = self._copy(orders=[("__name__", "ASCENDING")], limit=None, start=None, end=None)._run()
+        size = max(1, -(-len(docs) // max(1, partition_count)))
+        bounds = [docs[i].reference for i in range(size, len(docs), size)]
+        for start, end in zip([None] + bounds, bounds + [None]):
+            yield FakePartition(self, start, end)
+
+
+#[start_at, end_at) by document reference, None = open ended
+class FakePartition:
+
+    def __init__(self, query, start_at, end_at):
+        self._query = query
+        self.start_at = start_at
+        self.end_at = end_at
+
+    def query(self):
+        query = self._query._copy(orders=[("__name__", "ASCENDING")])
+        if self.start_at is not None:
+            query = query.start_at([self.start_at])
+        if self.end_at is not None:
+            query = query.end_before([self.end_at])
+        return query
+
+
+class FakeCollectionReference(FakeQuery):
+
+    def __init__(self, db, path):
+        super().__init__(db, path=path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class FakeTransaction:
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query._get()])
+        return iter(ref_or_query._run())
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(("set", ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._writes.append(("update", ref.path, data, None))
+
+    def delete(self, ref):
+        self._writes.append(("delete", ref.path, None, None))
+
+    def _commit(self):
+        for op, path, data, merge in self._writes:
+            if op == "set":
+                self._db._write(path, data, merge=merge)
+            elif op == "update":
+                self._db._update(path, data)
+            else:
+                self._db._delete(path)
+        self._writes = []
+
+
+class FakeWriteBatch(FakeTransaction):
+
+    def commit(self):
+        self._db.latency.wait("firestore")
+        with self._db._lock:
+            self._commit()
+
+
+#firestore BulkWriter: writes are applied as they are queued, flush/close just pay one round trip
+#write options (preconditions) are accepted and ignored
+class FakeBulkWriter:
+
+    def __init__(self, db):
+        self._db = db
+
+    def set(self, ref, data, merge=False):
+        self._db._write(ref.path, data, merge=merge)
+
+    def update(self, ref, data, option=None):
+        self._db._update(ref.path, data)
+
+    def delete(self, ref, option=None):
+        self._db._delete(ref.path)
+
+    def on_write_error(self, callback):
+        pass
+
+    def flush(self):
+        self._db.latency.wait("firestore")
+
+    def close(self):
+        self.flush()
+
+
+#stands in for firestore.transactional: runs the function once under the store lock, then commits
+def fake_transactional(fn):
+    def run(transaction, *args, **kwargs):
+        transaction._db.latency.wait("firestore")
+        with transaction._db._lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction._commit()
+        return result
+    return run
+
+
+class FakeFirestore:
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def collection_group(self, name):
+        return FakeQuery(self, group=name)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def bulk_writer(self, **kwargs):
+        return FakeBulkWriter(self)
+
+    def write_option(self, **kwargs):
+        return None
+
+    def get_all(self, references):
+        self.latency.wait("firestore")
+        for ref in references:
+            yield ref._get()
+
+    def _read(self, path):
+        with self._lock:
+            data = self._docs.get(path)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _write(self, path, data, merge=False):
+        with self._lock:
+            current = self._docs.get(path, {}) if merge else {}
+            self._docs[path] = _apply_update(dict(current), data)
+
+    def _update(self, path, data):
+        with self._lock:
+            if path not in self._docs:
+                raise KeyError(f"No document to update: {path}")
+            _apply_update(self._docs[path], data)
+
+    def _delete(self, path):
+        with self._lock:
+            self._docs.pop(path, None)
+
+    def _scan(self, path=None, group=None):
+        with self._lock:
+            items = list(self._docs.items())
+        for doc_path, data in items:
+            parent, _ = _split(doc_path)
+            if path is not None and parent == path:
+                yield doc_path, copy.deepcopy(data)
+            elif group is not None and parent.rsplit("/", 1)[-1] == group:
+                yield doc_path, copy.deepcopy(data)
+
+
+# === VAD model ===
+
+#deterministic raw (1-5 scale) VAD scores per text, one latency hit per call / per batch
+class FakeVADBackend:
+
+    name = "fake-vad"
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+
+    @staticmethod
+    def _score(text):
+        digest = hashlib.sha256((text or "").encode("utf-8")).digest()
+        return tuple(1 + 4 * b / 255 for b in digest[:3])
+
+    def predict(self, text):
+        self.latency.wait("vad")
+        return self._score(text)
+
+    def predict_batch(self, texts):
+        self.latency.wait("vad")
+        return [self._score(text) for text in texts]
+
+    def warmup(self):
+        pass
+
+
+# === Gemini ===
+
+GENRES = ["lo-fi", "ambient", "jazz", "indie pop", "classical", "acoustic", "chillhop"]
+
+
+class FakeResponse:
+
+    def __init__(self, text):
+        self.text = text
+
+
+#replies in the json shapes of the response schemas in utils/llms/structured.py
+def fake_llm_text(contents):
+    rng = random.Random(hashlib.sha256(str(contents).encode("utf-8")).hexdigest())
+    if "music genres" in str(contents):
+        return json.dumps(rng.sample(GENRES, 3))
+    issues = [{"issue": f"Issue {i}", "steps": ["step 1", "step 2"], "therapies": ["Therapy 1"],
+               "sources": ["https://www.nimh.nih.gov/health"]} for i in range(1, 4)]
+    return json.dumps(issues)
+
+
+class FakeModels:
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config=None):
+        self.latency.wait("gemini")
+        return FakeResponse(fake_llm_text(contents))
+
+    def generate_content_stream(self, model, contents, config=None):
+        text = fake_llm_text(contents)
+        step = max(1, len(text) // 8)
+        for i in range(0, len(text), step):
+            time.sleep(self.latency._delay() / 8)
+            yield FakeResponse(text[i:i + step])
+
+
+class FakeGemini:
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.models = FakeModels(self.latency)
+
+
+# === Spotify ===
+
+class FakeSpotify:
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+
+    def _artists(self, genre):
+        rng = random.Random(genre)
+        return [{'id': f"{genre}-artist-{rng.randint(0, 30)}", 'name': f"{genre} artist {i}"} for i in range(10)]
+
+    def _tracks(self, artist_id):
+        return [{'name': f"{artist_id} track {i}", 'id': f"{artist_id}-{i}",
+                 'album': {'images': [{'url': f"https://img.example/{artist_id}/{i}.jpg"}]}} for i in range(10)]
+
+    def search(self, q, type='artist', limit=10):
+        self.latency.wait("spotify")
+        return {'artists': {'items': self._artists(q.split('"')[1])[:limit]}}
+
+    def artist_top_tracks(self, artist_id, country='US'):
+        self.latency.wait("spotify")
+        return {'tracks': self._tracks(artist_id)}
+
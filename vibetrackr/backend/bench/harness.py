@@ -0,0 +1,63 @@
+import os
+import time
+import tempfile
+from firebase_admin import auth, firestore
+from bench.fakes import Latency, FakeFirestore, FakeVADBackend, FakeGemini, FakeSpotify, fake_transactional
+
+
+#one set of fakes, each service with its own latency / error profile
+class Fakes:
+
+    def __init__(self, firestore_latency=None, vad_latency=None, gemini_latency=None, spotify_latency=None):
+        self.db = FakeFirestore(firestore_latency)
+        self.vad = FakeVADBackend(vad_latency)
+        self.gemini = FakeGemini(gemini_latency)
+        self.spotify = FakeSpotify(spotify_latency)
+
+    #seeding / setup without paying the fake latency
+    def instant(self):
+        return _Instant(self)
+
+
+class _Instant:
+
+    def __init__(self, fakes):
+        self.fakes = fakes
+
+    def __enter__(self):
+        self.saved = self.fakes.db.latency, self.fakes.vad.latency
+        self.fakes.db.latency = self.fakes.vad.latency = Latency()
+        return self.fakes
+
+    def __exit__(self, *exc):
+        self.fakes.db.latency, self.fakes.vad.latency = self.saved
+
+
+#any bearer token is accepted, the token itself is the uid
+def fake_verify_id_token(id_token, check_revoked=False):
+    return {'uid': id_token, 'exp': time.time() + 3600}
+
+
+#import app.py with every external service swapped for the fakes
+#env is applied first since the app + utils read their settings at import time
+#must run before anything else in the process imports app / database.summary
+def load_app(fakes, env=None):
+    for key, value in (env or {}).items():
+        os.environ[key] = str(value)
+    os.environ.setdefault("JOURNAL_INDEX_PATH", tempfile.mkdtemp(prefix="bench-index-"))
+
+    firestore.transactional = fake_transactional
+    auth.verify_id_token = fake_verify_id_token
+
+    from database import dbsetup
+    dbsetup.load_firebase_app = lambda: fakes.db
+
+    from utils.llms import query, prompts
+    query.make_client = lambda: fakes.gemini
+    prompts.get_spotify_client = lambda: fakes.spotify
+
+    from utils.ml import query_api_bert
+    query_api_bert.vad_backend = fakes.vad
+
+    import app
+    return app
@@ -0,0 +1,51 @@
+import time
+import random
+import numpy as np
+
+
+#best-of-repeats time per call of fn over items (each item used once per repeat)
+def timed(fn, items, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    per_op = best / len(items)
+    return {'ops': len(items), 'us_per_op': per_op * 1e6, 'ops_per_sec': 1 / per_op if per_op else None}
+
+
+#classification + scoring hot paths, single and vectorized, plus analyze_journal on cache misses and hits
+#the vad backend must already be a zero-latency fake (see run.py) so only local work is measured
+def run_micro(n=2000, batch=1000, seed=0):
+    from utils.ml import query_api_bert
+    from utils.ml.emotions import classify_emotion, classify_emotions, vibescore, vibescores
+
+    rng = np.random.default_rng(seed)
+    vads = rng.uniform(-1, 1, size=(n, 3))
+    batches = [rng.uniform(-1, 1, size=(batch, 3)) for _ in range(20)]
+
+    words = "calm tired happy stressed exams friends rain work sleep anxious proud lonely music walk".split()
+    rand = random.Random(seed)
+    texts = [" ".join(rand.choices(words, k=60)) + f" {i}" for i in range(n)]
+    raw_batches = [rng.uniform(1, 5, size=(batch, 3)) for _ in range(20)]
+
+    results = {
+        'classify_emotion': timed(classify_emotion, vads),
+        'classify_emotions_per_row': timed(classify_emotions, batches),
+        'vibescore': timed(lambda vad: vibescore(*vad), vads),
+        'vibescores_per_row': timed(vibescores, batches),
+        'analyze_vads_per_row': timed(query_api_bert.analyze_vads, raw_batches),
+    }
+    for name in ('classify_emotions_per_row', 'vibescores_per_row', 'analyze_vads_per_row'):
+        result = results[name]
+        result['us_per_op'] /= batch
+        result['ops_per_sec'] *= batch
+        result['ops'] *= batch
+
+    query_api_bert.vad_cache.clear()
+    results['analyze_journal_miss'] = timed(query_api_bert.analyze_journal, texts, repeats=1)
+    results['analyze_journal_hit'] = timed(query_api_bert.analyze_journal, texts)
+    return results
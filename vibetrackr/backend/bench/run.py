@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bench.fakes import Latency
+from bench.harness import Fakes, load_app
+from bench.micro import run_micro
+
+
+#benchmark the app.py routes against local fakes + microbenchmark the analysis hot paths
+#run from vibetrackr/backend:
+#   python -m bench.run --requests 300 --concurrency 8
+#   python -m bench.run --vad-ms 250 --gemini-ms 1200 --error-rate 0.01 --env ASYNC_ANALYSIS=1 --out bench/results/queued.json
+#   python -m bench.compare bench/results/<old>.json bench/results/<new>.json
+#app settings (ASYNC_ANALYSIS, VAD_BATCH_WINDOW_MS, LLM_CACHE_SIZE=0, ...) are passed with --env
+
+WORDS = ("today i felt calm tired happy stressed about exams but my friends helped and the rain "
+         "made work slow so i went for a walk listened to music slept early and feel proud lonely hopeful").split()
+
+
+def journal_text(rng, words=80):
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+#journals written straight into the fake store (analyzed in one batch), then the summary doc rebuilt
+def seed_user(app, fakes, uid, journals, rng):
+    from database import summary
+    from database.queries import journals_ref
+    from utils.ml.query_api_bert import analyze_vads
+
+    client = app.app.test_client()
+    client.post('/create-user', headers={'Authorization': f'Bearer {uid}'},
+                json={'name': uid, 'email': f'{uid}@bench.local', 'timezone': {'timeZone': 'America/New_York'}})
+
+    texts = [journal_text(rng) for _ in range(journals)]
+    analyses = analyze_vads([fakes.vad._score(text) for text in texts])
+    start = int(time.time()) - journals * 86400
+    ids = []
+    for i, (text, analysis) in enumerate(zip(texts, analyses)):
+        ts = start + i * 86400
+        ref = journals_ref(fakes.db, uid).document()
+        ref.set({'title': f'Day {i}', 'content': text, 'analysis': analysis, 'timestamp': ts,
+                 'date': datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')})
+        ids.append(ref.id)
+    summary.rebuild_summary(fakes.db, uid)
+    return ids
+
+
+#endpoint name -> fn(rng) returning (uid, method, path, test client kwargs) for one request
+def scenarios(users, ids, spare_ids):
+    def user(rng):
+        return rng.choice(users)
+
+    def get(path):
+        return lambda rng: (user(rng), 'GET', path, {})
+
+    def add_journal(rng):
+        return user(rng), 'POST', '/add-journal', {'json': {'title': 'Bench', 'content': journal_text(rng)}}
+
+    def update_journal(rng):
+        uid = user(rng)
+        return uid, 'PUT', f'/update-journal?journal_id={rng.choice(ids[uid])}', \
+            {'json': {'title': 'Edited', 'content': journal_text(rng)}}
+
+    def delete_journal(rng):
+        uid = rng.choice([u for u in users if spare_ids[u]] or users)
+        journal_id = spare_ids[uid].pop() if spare_ids[uid] else rng.choice(ids[uid])
+        return uid, 'DELETE', f'/delete-journal?journal_id={journal_id}', {}
+
+    return {
+        'get-user': get('/get-user'),
+        'get-summary': get('/get-summary'),
+        'mood-trends': get('/mood-trends?granularity=week'),
+        'add-todays-journal': get('/add-todays-journal'),
+        'get-journals': get('/get-journals?limit=20'),
+        'get-journals-all': get('/get-journals'),
+        'export-journals': get('/export-journals?format=ndjson&gzip=1'),
+        'add-journal': add_journal,
+        'update-journal': update_journal,
+        'delete-journal': delete_journal,
+        'search-journals': lambda rng: (user(rng), 'GET', f"/search-journals?q={'+'.join(rng.sample(WORDS, 3))}", {}),
+        'days-like-today': get('/days-like-today'),
+        'get-spot-recs': get('/get-spot-recs'),
+        'get-mood-mentor': get('/get-mood-mentor'),
+        'stream-mood-mentor': get('/stream-mood-mentor'),
+    }
+
+
+def percentiles(latencies):
+    ms = np.asarray(latencies) * 1000
+    if not len(ms):
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'mean_ms': float(ms.mean()), 'max_ms': float(ms.max())}
+
+
+#fire `requests` calls at one endpoint from `concurrency` threads (each with its own test client)
+#latency covers reading the whole body, so streamed responses are timed to their last chunk
+def run_endpoint(app, build, requests, concurrency, seed):
+    rng = random.Random(seed)
+    calls = [build(rng) for _ in range(requests)]
+    clients = {}
+
+    def call(args):
+        uid, method, path, kwargs = args
+        client = clients.setdefault(threading.get_ident(), app.app.test_client())
+        start = time.perf_counter()
+        try:
+            response = client.open(path, method=method, headers={'Authorization': f'Bearer {uid}'}, **kwargs)
+            response.get_data()
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, calls))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for elapsed, ok in results if ok]
+    return {'requests': requests, 'errors': sum(1 for _, ok in results if not ok),
+            'rps': requests / wall if wall else None, 'wall_s': wall, **percentiles(latencies)}
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        env[key] = value
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VibeTrackr API against local fakes")
+    parser.add_argument('--requests', type=int, default=200, help="requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--journals', type=int, default=60, help="seeded journals per user")
+    parser.add_argument('--endpoints', nargs='*', help="only these endpoints (default all)")
+    parser.add_argument('--firestore-ms', type=float, default=8)
+    parser.add_argument('--vad-ms', type=float, default=300)
+    parser.add_argument('--gemini-ms', type=float, default=1500)
+    parser.add_argument('--spotify-ms', type=float, default=80)
+    parser.add_argument('--jitter', type=float, default=0.2, help="latency stddev as a fraction of the mean")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="injected failure rate for every fake")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="app setting (repeatable)")
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="results json (default bench/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    def latency(mean_ms, offset):
+        return Latency(mean_ms, mean_ms * args.jitter, args.error_rate, seed=args.seed * 10 + offset)
+
+    fakes = Fakes(latency(args.firestore_ms, 0), latency(args.vad_ms, 1), latency(args.gemini_ms, 2), latency(args.spotify_ms, 3))
+    env = parse_env(args.env)
+    app = load_app(fakes, env)
+
+    rng = random.Random(args.seed)
+    users = [f'bench-user-{i}' for i in range(args.users)]
+    ids, spare_ids = {}, {}
+    with fakes.instant():
+        for uid in users:
+            seeded = seed_user(app, fakes, uid, args.journals + args.requests // args.users + 1, rng)
+            ids[uid], spare_ids[uid] = seeded[:args.journals], seeded[args.journals:]
+
+    endpoints = {}
+    if not args.skip_load:
+        for i, (name, build) in enumerate(scenarios(users, ids, spare_ids).items()):
+            if args.endpoints and name not in args.endpoints:
+                continue
+            endpoints[name] = run_endpoint(app, build, args.requests, args.concurrency, args.seed + i)
+            print(f"{name:20s} rps {endpoints[name]['rps']:8.1f}  p50 {endpoints[name]['p50_ms'] or 0:8.1f}ms  "
+                  f"p95 {endpoints[name]['p95_ms'] or 0:8.1f}ms  p99 {endpoints[name]['p99_ms'] or 0:8.1f}ms  "
+                  f"errors {endpoints[name]['errors']}", flush=True)
+
+    micro = {}
+    if not args.skip_micro:
+        with fakes.instant():
+            micro = run_micro(seed=args.seed)
+        for name, result in micro.items():
+            print(f"{name:28s} {result['us_per_op']:10.2f} us/op", flush=True)
+
+    commit = git_commit()
+    results = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+            'env': env,
+        },
+        'endpoints': endpoints,
+        'micro': micro,
+    }
+
+    out = args.out or os.path.join('bench', 'results', f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"saved {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import time
+import uuid
+import hashlib
+from datetime import datetime
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from database.profiles import get_tz, local_now
+from database.queries import journals_ref
+from database.summary import rebuild_summary
+from utils.ml.query_api_bert import analyze_journals
+from utils.llms.context import summarize_journal
+
+
+#bulk journal imports: analysis runs a chunk at a time through the batched vad path and each
+#chunk is committed with one WriteBatch together with the job's progress, so a failed job can
+#resume from the last committed chunk (journal ids are derived from the job id + entry index)
+#each run of a job has its own run id on the job doc: a resume hands the job to a new run and an
+#older run that is still alive (or still waiting in a queue) stops at its next chunk
+
+CHUNK_SIZE = 499 #+1 write for the job doc = firestore's 500 writes per batch
+MAX_ERRORS = 50
+#a queued / running job whose updated_at hasn't moved for this long is taken to have lost its worker
+#(killed by a deploy, oom or timeout before fail_import could run) and can be resumed like a failed one
+IMPORT_LEASE = float(os.environ.get("IMPORT_LEASE", 15 * 60))
+
+
+def imports_ref(db, uid):
+    return db.collection('users').document(uid).collection('imports')
+
+
+def import_journal_id(job_id, index):
+    return "import-" + hashlib.sha256(f"{job_id}:{index}".encode("utf-8")).hexdigest()[:24]
+
+
+#title / content / optional date (YYYY-MM-DD) and/or timestamp, filled in the user's timezone
+def normalize_entry(entry, timezone):
+    if not isinstance(entry, dict) or not isinstance(entry.get('content'), str) or not entry['content'].strip():
+        raise ValueError("entry needs a non-empty content string")
+
+    journal = {'title': str(entry.get('title') or ''), 'content': entry['content']}
+    content_summary = summarize_journal(entry['content'])
+    if content_summary:
+        journal['content_summary'] = content_summary
+    timestamp, date = entry.get('timestamp'), entry.get('date')
+
+    if timestamp is not None and date is None:
+        timestamp = int(timestamp)
+        date = datetime.fromtimestamp(timestamp, get_tz(timezone)).strftime('%Y-%m-%d')
+    elif date is not None and timestamp is None:
+        timestamp = int(get_tz(timezone).localize(datetime.strptime(date, '%Y-%m-%d')).timestamp())
+    elif date is None and timestamp is None:
+        timestamp, date = local_now(timezone)
+    else:
+        timestamp = int(timestamp)
+        datetime.strptime(date, '%Y-%m-%d')
+
+    journal['timestamp'], journal['date'] = timestamp, date
+    return journal
+
+
+def create_job(db, uid, job_id, total):
+    job = {'status': 'queued', 'total': total, 'processed': 0, 'imported': 0, 'failed': 0,
+           'errors': [], 'run': uuid.uuid4().hex, 'created_at': time.time(), 'updated_at': time.time()}
+    imports_ref(db, uid).document(job_id).set(job)
+    return job
+
+
+def get_job(db, uid, job_id):
+    snapshot = imports_ref(db, uid).document(job_id).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def resumable(job, now=None):
+    if job['status'] == 'failed':
+        return True
+    return job['status'] in ('queued', 'running') and (now or time.time()) - job['updated_at'] > IMPORT_LEASE
+
+
+#hand a failed (or abandoned) job to a new run so exactly one re-post resumes it, None if the job is
+#still in flight or another request resumed it first (the write is guarded by the doc's update time)
+def resume_job(db, uid, job_id):
+    job_ref = imports_ref(db, uid).document(job_id)
+    snapshot = job_ref.get()
+    job = snapshot.to_dict() if snapshot.exists else None
+    if job is None or not resumable(job):
+        return None
+    update = {'status': 'queued', 'run': uuid.uuid4().hex, 'updated_at': time.time()}
+    try:
+        job_ref.update(update, option=db.write_option(last_update_time=snapshot.update_time))
+    except (FailedPrecondition, NotFound):
+        return None
+    return {**job, **update}
+
+
+#runs in the background, safe to call again for the same job (it picks up after the last chunk)
+#False if the job was handed to another run (resumed elsewhere) before this one finished
+def run_import(db, uid, job_id, entries, timezone, run_id=None):
+    job_ref = imports_ref(db, uid).document(job_id)
+    job = job_ref.get().to_dict()
+    if job.get('run') != run_id:
+        return False
+    job_ref.update({'status': 'running', 'updated_at': time.time()})
+
+    first = job['processed']
+    for start in range(first, len(entries), CHUNK_SIZE):
+        if start > first and job_ref.get().to_dict().get('run') != run_id:
+            return False
+        chunk = entries[start:start + CHUNK_SIZE]
+
+        journals = {}
+        for index, entry in enumerate(chunk, start):
+            try:
+                journals[index] = normalize_entry(entry, timezone)
+            except (ValueError, TypeError) as e:
+                job['failed'] += 1
+                if len(job['errors']) < MAX_ERRORS:
+                    job['errors'].append({'index': index, 'error': str(e)})
+
+        analyses = analyze_journals([journal['content'] for journal in journals.values()])
+
+        batch = db.batch()
+        for (index, journal), analysis in zip(journals.items(), analyses):
+            batch.set(journals_ref(db, uid).document(import_journal_id(job_id, index)), {**journal, 'analysis': analysis})
+
+        job['processed'] = start + len(chunk)
+        job['imported'] += len(journals)
+        job['updated_at'] = time.time()
+        batch.update(job_ref, {k: job[k] for k in ('processed', 'imported', 'failed', 'errors', 'updated_at')})
+        batch.commit()
+
+    rebuild_summary(db, uid)
+    job_ref.update({'status': 'done', 'updated_at': time.time()})
+    return True
+
+
+#called by the work queue once retries are exhausted, the job can still be resumed by re-posting it
+def fail_import(error, db, uid, job_id, entries, timezone, run_id=None):
+    job_ref = imports_ref(db, uid).document(job_id)
+    if job_ref.get().to_dict().get('run') != run_id: #a newer run owns the job now
+        return
+    job_ref.update({'status': 'failed', 'error': str(error), 'updated_at': time.time()})
@@ -0,0 +1,52 @@
+import os
+import time
+import uuid
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+
+#async analysis jobs only live in the process that queued them (utils/work_queue.py), so a restart or
+#scale-down drops them and their journals would stay "pending". journals record when their job was
+#queued (analysis_queued_at) and a periodic sweep claims the ones that have waited too long and queues
+#them again. the claim is a write guarded by the doc's update time, so with several instances only one
+#re-queues a journal, and a late result from the old job is ignored (its analysis_job no longer matches)
+
+PENDING_STALE = float(os.environ.get("PENDING_STALE", 15 * 60))
+PENDING_SWEEP_LIMIT = int(os.environ.get("PENDING_SWEEP_LIMIT", 500))
+
+
+def uid_of(path):
+    return path.split("/")[1] #users/{uid}/journals/{id}
+
+
+#pending journals of every user queued more than older_than seconds ago (or before queue times were stored)
+#only in-flight analyses are pending, so the collection-group scan stays small
+def stale_pending(db, older_than=PENDING_STALE):
+    cutoff = time.time() - older_than
+    query = db.collection_group('journals').where(filter=FieldFilter('analysis', '==', 'pending'))
+    for doc in query.stream():
+        if (doc.to_dict().get('analysis_queued_at') or 0) <= cutoff:
+            yield doc
+
+
+#take over a stale journal with a new job id, False if it changed since it was read
+def claim(db, doc, job_id):
+    try:
+        doc.reference.update({'analysis_job': job_id, 'analysis_queued_at': time.time()},
+                             option=db.write_option(last_update_time=doc.update_time))
+        return True
+    except (FailedPrecondition, NotFound): #analyzed, edited, deleted or claimed elsewhere meanwhile
+        return False
+
+
+#enqueue(uid, journal_id, content, job_id) is the app's queue_analysis, returns how many were re-queued
+def recover_pending(db, enqueue, older_than=PENDING_STALE, limit=PENDING_SWEEP_LIMIT):
+    recovered = 0
+    for doc in stale_pending(db, older_than):
+        if recovered >= limit:
+            break
+        job_id = uuid.uuid4().hex
+        if claim(db, doc, job_id):
+            enqueue(uid_of(doc.reference.path), doc.id, doc.to_dict().get('content'), job_id)
+            recovered += 1
+    return recovered
@@ -0,0 +1,51 @@
+import os
+from datetime import datetime
+from functools import lru_cache
+import pytz
+from utils.cache import LRUCache
+from utils.metrics import span, timed
+
+
+#user profile docs (name, email, timezone) barely change, so keep them in memory for a short ttl
+#writes from /create-user go through set_profile and refresh the cache directly
+profile_cache = LRUCache(maxsize=int(os.environ.get("PROFILE_CACHE_SIZE", 10000)),
+                         ttl=float(os.environ.get("PROFILE_CACHE_TTL", 300)))
+
+
+def get_profile(db, uid):
+    profile = profile_cache.get(uid)
+    if profile is None:
+        with span("firestore.profile.get"):
+            doc = db.collection('users').document(uid).get()
+        if not doc.exists:
+            return None
+        profile = doc.to_dict()
+        profile_cache.set(uid, profile)
+    return dict(profile)
+
+
+@timed("firestore.profile.set")
+def set_profile(db, uid, profile):
+    db.collection('users').document(uid).set(profile)
+    profile_cache.set(uid, dict(profile))
+
+
+def invalidate_profile(uid):
+    profile_cache.delete(uid)
+
+
+def get_timezone(db, uid):
+    return get_profile(db, uid)["timezone"]
+
+
+#pytz zone objects are immutable, build each one once
+@lru_cache(maxsize=None)
+def get_tz(timezone):
+    return pytz.timezone(timezone)
+
+
+#(unix timestamp, YYYY-MM-DD) for the same instant in the user's timezone
+def local_now(timezone):
+    now = datetime.now(get_tz(timezone))
+    return int(now.timestamp()), now.strftime('%Y-%m-%d')
+
@@ -0,0 +1,86 @@
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from utils.metrics import timed
+
+
+#shared journal queries: ordered + limited on the firestore side instead of streaming and sorting in python
+#date range + timestamp ordering is backed by the composite indexes in firestore.indexes.json
+
+MAX_PAGE_SIZE = 500
+
+
+def journals_ref(db, uid):
+    return db.collection('users').document(uid).collection('journals')
+
+
+#build the query; cursors are journal ids, dates are the stored YYYY-MM-DD strings (inclusive)
+#before = older than the cursor journal, after = newer than it
+def journals_query(db, uid, limit=None, before=None, after=None, start_date=None, end_date=None, newest_first=True):
+    ref = journals_ref(db, uid)
+    query = ref
+
+    if start_date:
+        query = query.where(filter=FieldFilter('date', '>=', start_date))
+    if end_date:
+        query = query.where(filter=FieldFilter('date', '<=', end_date))
+
+    #paging towards newer entries walks the index ascending (results are flipped back afterwards)
+    descending = newest_first and not after
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+    if start_date or end_date:
+        query = query.order_by('date', direction=direction)
+    query = query.order_by('timestamp', direction=direction)
+
+    cursor_id = before or after
+    if cursor_id:
+        cursor = ref.document(cursor_id).get()
+        if not cursor.exists:
+            raise KeyError(cursor_id)
+        query = query.start_after(cursor)
+
+    if limit:
+        query = query.limit(limit + 1) #room for the init_journal placeholder
+    return query
+
+
+#returns (journals, next_cursor), next_cursor is the id to pass back as before/after for the next page
+@timed("firestore.query_journals")
+def query_journals(db, uid, limit=None, before=None, after=None, start_date=None, end_date=None, newest_first=True):
+    query = journals_query(db, uid, limit=limit, before=before, after=after,
+                           start_date=start_date, end_date=end_date, newest_first=newest_first)
+
+    journals = [{**doc.to_dict(), 'id': doc.id} for doc in query.stream() if doc.id != "init_journal"]
+    if limit:
+        journals = journals[:limit]
+
+    next_cursor = journals[-1]['id'] if limit and len(journals) == limit else None
+    if after and newest_first:
+        journals.reverse()
+    return journals, next_cursor
+
+
+#same query, yielded one journal at a time as firestore streams them (constant memory for exports)
+#nothing is buffered, so pages walked with after come out oldest first
+#the query (and cursor lookup) is built up front so a bad cursor raises before the response starts
+def stream_journals(db, uid, limit=None, before=None, after=None, start_date=None, end_date=None):
+    query = journals_query(db, uid, limit=limit, before=before, after=after,
+                           start_date=start_date, end_date=end_date)
+
+    def generate():
+        sent = 0
+        for doc in query.stream():
+            if doc.id == "init_journal":
+                continue
+            if limit and sent >= limit:
+                break
+            sent += 1
+            yield {**doc.to_dict(), 'id': doc.id}
+    return generate()
+
+
+#full journal docs for a list of ids in one batched read, in the given order (missing ids skipped)
+@timed("firestore.journals_by_id")
+def get_journals_by_id(db, uid, journal_ids):
+    ref = journals_ref(db, uid)
+    docs = {doc.id: doc for doc in db.get_all([ref.document(journal_id) for journal_id in journal_ids]) if doc.exists}
+    return [{**docs[journal_id].to_dict(), 'id': journal_id} for journal_id in journal_ids if journal_id in docs]
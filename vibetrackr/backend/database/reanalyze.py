@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from firebase_admin import firestore
+from database.pending import uid_of
+from database.summary import rebuild_summary
+from utils.ml.query_api_bert import analyze_vads, cached_vad_batch
+
+
+#re-score every stored journal after EMOTION_VAD / scaling changes, without calling the vad model:
+#   python -m database.reanalyze --parallelism 16 --checkpoint reanalyze.json [--dry-run] [--local]
+#users/*/journals is read with a partitioned collection-group query, one thread per partition paging
+#by document name. each page is re-classified in one numpy batch (analyze_vads) from the stored raw
+#scores and changed analyses go back through a BulkWriter (guarded by the doc's update time, so
+#journals edited mid-run are left alone). with --remote, journals without stored scores (including
+#pending ones whose background job was lost) go through the model. progress is checkpointed per page,
+#rerunning with the same checkpoint resumes (and retries writes that kept failing, they are listed in
+#the checkpoint). summary + trend docs of users with changes are rebuilt at the end
+
+PAGE_SIZE = 1000
+FAILED_PRECONDITION = 9 #google.rpc.Code, the journal changed after it was read
+WRITE_ATTEMPTS = 5 #per journal write, other errors (unavailable, deadline...) are retried by the bulk writer
+TOLERANCE = 1e-9
+
+
+#raw 1-5 model scores for a stored analysis: Raw_VAD when present, otherwise V/A/D mapped back
+#through the scaling they were written with (2 * x / 5 - 1, used before Raw_VAD was stored)
+def stored_raw_vad(analysis):
+    if not isinstance(analysis, dict):
+        return None
+    raw = analysis.get("Raw_VAD")
+    if isinstance(raw, list) and len(raw) == 3:
+        return raw
+    if all(isinstance(analysis.get(field), (int, float)) for field in ("V", "A", "D")):
+        return [(analysis[field] + 1) * 5 / 2 for field in ("V", "A", "D")]
+    return None
+
+
+def changed(old, new):
+    if not isinstance(old, dict): #'failed' analyses re-scored through the model
+        return True
+    for key, value in new.items():
+        if isinstance(value, float):
+            if not isinstance(old.get(key), (int, float)) or abs(old[key] - value) > TOLERANCE:
+                return True
+        elif key == "Raw_VAD":
+            if not isinstance(old.get(key), list) or not np.allclose(old[key], value, atol=TOLERANCE):
+                return True
+        elif old.get(key) != value:
+            return True
+    return False
+
+
+STAT_KEYS = ("read", "updated", "skipped", "remote", "conflicts")
+
+
+#progress on disk, written per partition so parallel partitions never wait on each other:
+#   {path}                    partition bounds, written once
+#   {path}.parts/{i}.json     that partition's cursor, done flag, stats and the paths of journals whose
+#                             write gave up (small, replaced per page)
+#   {path}.parts/{i}.users    uids with changed journals, appended as they are found
+#path=None keeps everything in memory (dry runs)
+class Checkpoint:
+
+    def __init__(self, path):
+        self.path = path
+        self.partitions = None
+        self.cursors, self.done, self.stats, self.failed, self._users = [], [], [], [], []
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._init(json.load(f)["partitions"])
+            for index in range(len(self.partitions)):
+                self._load_part(index)
+
+    def _init(self, partitions):
+        self.partitions = partitions
+        self.cursors = [None] * len(partitions)
+        self.done = [False] * len(partitions)
+        self.stats = [dict.fromkeys(STAT_KEYS, 0) for _ in partitions]
+        self.failed = [[] for _ in partitions]
+        self._users = [set() for _ in partitions]
+
+    def _part(self, index, suffix):
+        return os.path.join(f"{self.path}.parts", f"{index}{suffix}")
+
+    def _load_part(self, index):
+        try:
+            with open(self._part(index, ".json")) as f:
+                part = json.load(f)
+            self.cursors[index], self.done[index], self.stats[index] = part["cursor"], part["done"], part["stats"]
+            self.failed[index] = part.get("failed", [])
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._part(index, ".users")) as f:
+                self._users[index].update(line.strip() for line in f if line.strip())
+        except FileNotFoundError:
+            pass
+
+    def start(self, partitions):
+        if self.partitions is None:
+            self._init(partitions)
+            if self.path:
+                os.makedirs(f"{self.path}.parts", exist_ok=True)
+                _write_atomic(self.path, {"partitions": partitions})
+        return self.partitions
+
+    #only ever called from the thread running that partition
+    #failed: journal paths whose write gave up, retried: listed paths that were just tried again
+    def advance(self, index, cursor, stats, users, done=False, failed=(), retried=()):
+        self.cursors[index] = cursor
+        self.done[index] = done
+        self.failed[index] = sorted((set(self.failed[index]) - set(retried)) | set(failed))
+        for key, value in stats.items():
+            self.stats[index][key] += value
+        new_users = set(users) - self._users[index]
+        self._users[index].update(new_users)
+        if not self.path:
+            return
+
+        if new_users: #before the cursor moves, a crash in between only means an extra rebuild
+            with open(self._part(index, ".users"), "a") as f:
+                f.write("".join(f"{uid}\n" for uid in sorted(new_users)))
+        _write_atomic(self._part(index, ".json"), {"cursor": cursor, "done": done, "stats": self.stats[index],
+                                                   "failed": self.failed[index]})
+
+    #failed = writes still outstanding, not every failure seen
+    def totals(self):
+        totals = {key: sum(stats[key] for stats in self.stats) for key in STAT_KEYS}
+        totals["failed"] = sum(len(failed) for failed in self.failed)
+        return totals
+
+    def users(self):
+        return sorted(set().union(*self._users))
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".reanalyze.")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+#[start, end) document paths per partition, end of one partition is the start of the next
+def partition_bounds(db, parallelism):
+    bounds = []
+    for partition in db.collection_group("journals").get_partitions(parallelism):
+        start, end = partition.start_at, partition.end_at
+        bounds.append([getattr(start, "path", None), getattr(end, "path", None)])
+    return bounds or [[None, None]]
+
+
+def page_query(db, start, end, after, page_size):
+    query = db.collection_group("journals").order_by("__name__")
+    if after:
+        query = query.start_after([db.document(after)])
+    elif start:
+        query = query.start_at([db.document(start)])
+    if end:
+        query = query.end_before([db.document(end)])
+    return query.limit(page_size)
+
+
+#recomputed analyses for one page: [(snapshot, new analysis)], plus how many had to go to the model
+def reanalyze_page(docs, remote=False):
+    rows, raws, missing = [], [], []
+    for doc in docs:
+        data = doc.to_dict()
+        raw = stored_raw_vad(data.get("analysis"))
+        if raw is not None:
+            rows.append(doc)
+            raws.append(raw)
+        elif remote and data.get("content"): #includes pending rows whose queued job was lost
+            missing.append(doc)
+
+    if missing: #no stored scores at all, fall back to the (cached, batched) model
+        raws.extend(cached_vad_batch([doc.to_dict()["content"] for doc in missing]))
+        rows.extend(missing)
+
+    analyses = analyze_vads(raws) if raws else []
+    return [(doc, analysis) for doc, analysis in zip(rows, analyses)
+            if changed(doc.to_dict().get("analysis"), analysis)], len(missing)
+
+
+def run_partition(db, checkpoint, index, page_size=PAGE_SIZE, remote=False, dry_run=False, log=print):
+    start, end = checkpoint.partitions[index]
+    after = checkpoint.cursors[index]
+    conflicts, failed = [], []
+
+    def on_error(failure, bulk_writer=None):
+        if failure.code == FAILED_PRECONDITION:
+            conflicts.append(failure)
+            return False
+        if failure.attempts < WRITE_ATTEMPTS:
+            return True
+        failed.append(failure.operation.reference.path)
+        return False
+
+    bulk = None
+    if not dry_run:
+        bulk = db.bulk_writer()
+        bulk.on_write_error(on_error)
+
+    #re-score + write one batch of journals: (stats, uids with changes, paths whose write gave up)
+    def process(docs):
+        updates, remote_calls = reanalyze_page(docs, remote)
+        if bulk is not None:
+            for doc, analysis in updates:
+                fields = {"analysis": analysis}
+                if not isinstance(doc.to_dict().get("analysis"), dict): #pending / failed, drop the job too
+                    fields.update(analysis_job=firestore.DELETE_FIELD, analysis_queued_at=firestore.DELETE_FIELD)
+                bulk.update(doc.reference, fields, option=db.write_option(last_update_time=doc.update_time))
+            bulk.flush() #page is durable before the checkpoint moves past it
+
+        gave_up = set(failed)
+        written = [doc for doc, _ in updates if doc.reference.path not in gave_up]
+        stats = {"read": len(docs), "updated": len(written) - len(conflicts), "skipped": len(docs) - len(updates),
+                 "remote": remote_calls, "conflicts": len(conflicts)}
+        conflicts.clear()
+        failed.clear()
+        return stats, [uid_of(doc.reference.path) for doc in written], gave_up
+
+    #writes that gave up in an earlier run (already counted as read / skipped there)
+    retry = checkpoint.failed[index]
+    if retry and bulk is not None:
+        docs = [doc for doc in db.get_all([db.document(path) for path in retry]) if doc.exists]
+        stats, users, gave_up = process(docs)
+        stats = {key: stats[key] for key in ("updated", "remote", "conflicts")}
+        checkpoint.advance(index, after, stats, users, done=checkpoint.done[index], failed=gave_up, retried=retry)
+        log(f"partition {index}: retried {len(retry)} failed writes, {len(gave_up)} still failing")
+
+    while True:
+        page = list(page_query(db, start, end, after, page_size).stream())
+        if not page:
+            checkpoint.advance(index, after, {}, [], done=True)
+            return
+
+        docs = [doc for doc in page if doc.id != "init_journal"]
+        stats, users, gave_up = process(docs)
+        after = page[-1].reference.path
+        checkpoint.advance(index, after, stats, users, failed=gave_up)
+        log(f"partition {index}: {stats}" + (f", {len(gave_up)} writes failed" if gave_up else ""))
+
+
+def rebuild_summaries(db, uids, parallelism, log=print):
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for done, _ in enumerate(executor.map(lambda uid: rebuild_summary(db, uid, text_changed=False), uids), 1):
+            if done % 1000 == 0:
+                log(f"rebuilt {done}/{len(uids)} summaries")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute stored journal analyses from their raw VAD scores")
+    parser.add_argument("--parallelism", type=int, default=8, help="collection-group partitions read at once")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--checkpoint", default="reanalyze-checkpoint.json",
+                        help="progress file (plus a .parts directory next to it), reused to resume")
+    parser.add_argument("--remote", action="store_true", help="run the vad model for journals with no stored scores")
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing")
+    parser.add_argument("--skip-summaries", action="store_true", help="don't rebuild summary / trend docs")
+    parser.add_argument("--local", action="store_true", help="use the local firebase credentials")
+    args = parser.parse_args(argv)
+
+    from database.dbsetup import load_firebase_app, load_firebase_local
+    db = load_firebase_local() if args.local else load_firebase_app()
+
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint)
+    partitions = checkpoint.start(partition_bounds(db, args.parallelism))
+    pending = [i for i, done in enumerate(checkpoint.done) if not done or checkpoint.failed[i]]
+    print(f"{len(partitions)} partitions, {len(pending)} left")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.parallelism) as executor:
+        futures = [executor.submit(run_partition, db, checkpoint, i, args.page_size, args.remote, args.dry_run)
+                   for i in pending]
+        for future in futures:
+            future.result()
+
+    stats = checkpoint.totals()
+    elapsed = time.time() - started
+    print(f"read {stats['read']} journals in {elapsed:.0f}s ({stats['read'] / max(elapsed, 1e-9):.0f}/s), "
+          f"{stats['updated']} updated, {stats['conflicts']} changed mid-run, {stats['remote']} sent to the model")
+    if stats["failed"]:
+        print(f"{stats['failed']} writes failed after {WRITE_ATTEMPTS} attempts, run again with the same checkpoint to retry them")
+
+    if not args.dry_run and not args.skip_summaries:
+        users = checkpoint.users()
+        rebuild_summaries(db, users, args.parallelism)
+        print(f"rebuilt summaries for {len(users)} users")
+
+
+if __name__ == "__main__":
+    main()
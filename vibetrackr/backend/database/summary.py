@@ -0,0 +1,306 @@
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from database.queries import journals_ref, journals_query
+from database.trends import trends_ref, empty_trends, load_trends, build_trends, apply_journal, SUM_DIGITS
+from utils.metrics import timed
+
+
+#per-user summary doc (users/{uid}/stats/summary) kept in step with every journal write so the
+#dashboard endpoints read one document instead of streaming the whole journals subcollection
+#the mood trend rollups (database/trends.py) are updated in the same transactions
+
+RECENT_SIZE = 5
+#times a full rebuild re-reads the journals when journal writes keep landing while it runs
+REBUILD_ATTEMPTS = 5
+SNIPPET_LENGTH = 200
+STAT_FIELDS = ["V", "A", "D", "Valence_Scaled_By_Mag"]
+
+
+def summary_ref(db, uid):
+    return db.collection('users').document(uid).collection('stats').document('summary')
+
+
+def empty_summary():
+    return {
+        'count': 0,
+        'last_date': None,
+        'last_timestamp': None,
+        'recent': [],  #newest first, at most RECENT_SIZE entries
+        'analyzed': 0,
+        'sums': {field: 0.0 for field in STAT_FIELDS},
+        'emotions': {},
+        'version': 0,
+        'text_version': 0,  #only bumped when journal text / the set of journals changes (search index stamp)
+    }
+
+
+def _bump_text(summary):
+    summary['text_version'] = summary.get('text_version', 0) + 1
+
+
+def _entry(journal_id, data):
+    return {
+        'id': journal_id,
+        'title': data.get('title'),
+        'snippet': (data.get('content') or '')[:SNIPPET_LENGTH],
+        'timestamp': data.get('timestamp'),
+        'date': data.get('date'),
+    }
+
+
+#add (sign=1) or remove (sign=-1) one journal's analysis from the running stats
+#sums are rounded like the trends columns so they don't drift away from a rebuild over many writes
+def _apply_analysis(summary, analysis, sign):
+    if not isinstance(analysis, dict): #pending / failed analyses are not counted yet
+        return
+
+    summary['analyzed'] += sign
+    for field in STAT_FIELDS:
+        summary['sums'][field] = round(summary['sums'][field] + sign * float(analysis.get(field, 0.0)), SUM_DIGITS)
+
+    emotion = analysis.get('Emotion')
+    if emotion:
+        summary['emotions'][emotion] = summary['emotions'].get(emotion, 0) + sign
+        if summary['emotions'][emotion] <= 0:
+            del summary['emotions'][emotion]
+
+
+def _set_recent(summary, recent):
+    recent = sorted(recent, key=lambda x: x['timestamp'] or 0, reverse=True)[:RECENT_SIZE]
+    summary['recent'] = recent
+    summary['last_date'] = recent[0]['date'] if recent else None
+    summary['last_timestamp'] = recent[0]['timestamp'] if recent else None
+
+
+def _push_recent(summary, journal_id, data):
+    recent = [e for e in summary['recent'] if e['id'] != journal_id]
+    _set_recent(summary, recent + [_entry(journal_id, data)])
+
+
+#rebuild from scratch (users created before the summary doc existed, or after a bulk change)
+def build_summary(journal_docs):
+    summary = empty_summary()
+    entries = []
+    for doc in journal_docs:
+        if doc.id == 'init_journal':
+            continue
+        data = doc.to_dict()
+        summary['count'] += 1
+        _apply_analysis(summary, data.get('analysis'), 1)
+        entries.append(_entry(doc.id, data))
+    _set_recent(summary, entries)
+    return summary
+
+
+def _load(transaction, db, uid):
+    snapshot = summary_ref(db, uid).get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict()
+    return build_summary(transaction.get(journals_query(db, uid)))
+
+
+#merged journal state after an update (DELETE_FIELD sentinels drop the key)
+def _merge(old, data):
+    merged = {**old, **data}
+    return {k: v for k, v in merged.items() if v is not firestore.DELETE_FIELD}
+
+
+@firestore.transactional
+def _add(transaction, db, uid, journal_ref, data):
+    summary = _load(transaction, db, uid)
+    trends = load_trends(transaction, db, uid)
+
+    summary['count'] += 1
+    _apply_analysis(summary, data.get('analysis'), 1)
+    apply_journal(trends, data, 1)
+    _push_recent(summary, journal_ref.id, data)
+    summary['version'] += 1
+    _bump_text(summary)
+
+    transaction.set(journal_ref, data)
+    transaction.set(summary_ref(db, uid), summary)
+    transaction.set(trends_ref(db, uid), trends)
+    return summary['text_version']
+
+
+@firestore.transactional
+def _update(transaction, db, uid, journal_ref, data):
+    snapshot = journal_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    summary = _load(transaction, db, uid)
+    trends = load_trends(transaction, db, uid)
+
+    old = snapshot.to_dict()
+    new = _merge(old, data)
+    _apply_analysis(summary, old.get('analysis'), -1)
+    _apply_analysis(summary, new.get('analysis'), 1)
+    apply_journal(trends, old, -1)
+    apply_journal(trends, new, 1)
+    _push_recent(summary, journal_ref.id, new)
+    summary['version'] += 1
+    _bump_text(summary)
+
+    transaction.update(journal_ref, data)
+    transaction.set(summary_ref(db, uid), summary)
+    transaction.set(trends_ref(db, uid), trends)
+    return summary['text_version']
+
+
+@firestore.transactional
+def _delete(transaction, db, uid, journal_ref):
+    snapshot = journal_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    summary = _load(transaction, db, uid)
+    trends = load_trends(transaction, db, uid)
+
+    summary['count'] -= 1
+    _apply_analysis(summary, snapshot.to_dict().get('analysis'), -1)
+    apply_journal(trends, snapshot.to_dict(), -1)
+
+    recent = [e for e in summary['recent'] if e['id'] != journal_ref.id]
+    if len(recent) < len(summary['recent']) and summary['count'] > len(recent):
+        #refill the ring buffer with the next newest journal(s)
+        query = journals_query(db, uid, limit=RECENT_SIZE + 1)
+        recent = [_entry(doc.id, doc.to_dict()) for doc in transaction.get(query)
+                  if doc.id not in ('init_journal', journal_ref.id)]
+    _set_recent(summary, recent)
+    summary['version'] += 1
+    _bump_text(summary)
+
+    transaction.delete(journal_ref)
+    transaction.set(summary_ref(db, uid), summary)
+    transaction.set(trends_ref(db, uid), trends)
+    return summary['text_version']
+
+
+#background analysis result, only applied if no newer edit has queued its own job since
+@firestore.transactional
+def _set_analysis(transaction, db, uid, journal_ref, job_id, analysis):
+    snapshot = journal_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.to_dict().get('analysis_job') != job_id:
+        return False
+    summary = _load(transaction, db, uid)
+    trends = load_trends(transaction, db, uid)
+
+    old = snapshot.to_dict()
+    _apply_analysis(summary, old.get('analysis'), -1)
+    _apply_analysis(summary, analysis, 1)
+    apply_journal(trends, old, -1)
+    apply_journal(trends, {**old, 'analysis': analysis}, 1)
+    summary['version'] += 1
+
+    transaction.update(journal_ref, {'analysis': analysis, 'analysis_job': firestore.DELETE_FIELD,
+                                     'analysis_queued_at': firestore.DELETE_FIELD})
+    transaction.set(summary_ref(db, uid), summary)
+    transaction.set(trends_ref(db, uid), trends)
+    return True
+
+
+#add / update / delete return the new text_version (update / delete: False if the journal is missing)
+@timed("firestore.summary.add")
+def add_journal_entry(db, uid, journal_ref, data):
+    return _add(db.transaction(), db, uid, journal_ref, data)
+
+
+@timed("firestore.summary.update")
+def update_journal_entry(db, uid, journal_ref, data):
+    return _update(db.transaction(), db, uid, journal_ref, data)
+
+
+@timed("firestore.summary.delete")
+def delete_journal_entry(db, uid, journal_ref):
+    return _delete(db.transaction(), db, uid, journal_ref)
+
+
+@timed("firestore.summary.set_analysis")
+def set_journal_analysis(db, uid, journal_ref, job_id, analysis):
+    return _set_analysis(db.transaction(), db, uid, journal_ref, job_id, analysis)
+
+
+#only for brand new users: /create-user is called again on google sign-in for existing accounts,
+#so docs that already exist are left alone instead of being reset to empty
+@timed("firestore.summary.init")
+def init_summary(db, uid):
+    for ref, empty in ((summary_ref(db, uid), empty_summary()), (trends_ref(db, uid), empty_trends())):
+        try:
+            ref.create(empty)
+        except AlreadyExists:
+            pass
+
+
+#stores a rebuild only if no journal write has moved the version since it was read (None otherwise)
+@firestore.transactional
+def _store_rebuild(transaction, db, uid, summary, trends, read_version, text_changed):
+    snapshot = summary_ref(db, uid).get(transaction=transaction)
+    previous = snapshot.to_dict() if snapshot.exists else {}
+    if previous.get('version', 0) != read_version:
+        return None
+    summary['version'] = read_version + 1
+    summary['text_version'] = previous.get('text_version', 0) + int(text_changed)
+    transaction.set(summary_ref(db, uid), summary)
+    transaction.set(trends_ref(db, uid), trends)
+    return summary
+
+
+#full rescan after bulk writes (imports), keeps the version moving forward (trends rebuilt too)
+#text_changed=False for rescans that only touched analyses (reanalyze), so search shards stay valid
+#every journal write bumps the version, so reading it before the scan and checking it again when
+#storing means a journal added / edited / deleted meanwhile is never lost (the scan is redone)
+@timed("firestore.summary.rebuild")
+def rebuild_summary(db, uid, text_changed=True):
+    for _ in range(REBUILD_ATTEMPTS):
+        previous = summary_ref(db, uid).get()
+        read_version = previous.to_dict().get('version', 0) if previous.exists else 0
+        docs = list(journals_ref(db, uid).stream())
+        summary = _store_rebuild(db.transaction(), db, uid, build_summary(docs), build_trends(docs),
+                                 read_version, text_changed)
+        if summary is not None:
+            return summary
+    raise RuntimeError(f"summary for {uid} kept changing during {REBUILD_ATTEMPTS} rebuilds")
+
+
+#one-off rebuild for users that predate the summary doc, in a transaction so a journal write
+#committing meanwhile makes it retry (and find that write's summary) instead of being overwritten
+@firestore.transactional
+def _init_from_journals(transaction, db, uid):
+    snapshot = summary_ref(db, uid).get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict()
+    summary = build_summary(transaction.get(journals_query(db, uid)))
+    transaction.set(summary_ref(db, uid), summary)
+    return summary
+
+
+#one document read (plus the one-off rebuild above)
+@timed("firestore.summary.get")
+def get_summary(db, uid):
+    snapshot = summary_ref(db, uid).get()
+    if snapshot.exists:
+        return snapshot.to_dict()
+    return _init_from_journals(db.transaction(), db, uid)
+
+
+#full docs for the ring buffer entries, newest first (at most RECENT_SIZE reads)
+@timed("firestore.recent_journals")
+def get_recent_journals(db, uid, summary=None):
+    summary = summary or get_summary(db, uid)
+    refs = [journals_ref(db, uid).document(e['id']) for e in summary['recent']]
+    docs = [doc for doc in db.get_all(refs) if doc.exists]
+    journals = [{**doc.to_dict(), 'id': doc.id} for doc in docs]
+    return sorted(journals, key=lambda x: x['timestamp'], reverse=True)
+
+
+#means + emotion counts for the api
+def summary_stats(summary):
+    analyzed = summary['analyzed']
+    return {
+        'count': summary['count'],
+        'analyzed': analyzed,
+        'last_date': summary['last_date'],
+        'means': {field: (summary['sums'][field] / analyzed if analyzed else None) for field in STAT_FIELDS},
+        'emotions': summary['emotions'],
+        'recent': summary['recent'],
+    }
+
@@ -0,0 +1,154 @@
+import os
+import bisect
+from datetime import date as Date
+from functools import lru_cache
+from firebase_admin import firestore
+from database.queries import journals_query
+from utils.metrics import timed
+
+
+#mood rollups (users/{uid}/stats/trends) kept in step with the summary doc inside the same transactions
+#one columnar series per granularity, buckets are the journal's stored date (already in the user's tz):
+#   {'keys': [...], 'count': [...], 'sums': {'V': [...], ...}, 'emotions': {'Sad': [...], ...}}
+#every list lines up with keys (sorted), so a chart is one small document read
+#incremental updates keep the doc equal to build_trends over the same journals: emotion columns
+#are dropped as soon as they are all zero and sums are rounded so adding then removing a journal
+#doesn't leave float residue behind
+
+STAT_FIELDS = ["V", "A", "D", "Valence_Scaled_By_Mag"] #same fields the summary doc sums
+GRANULARITIES = ("day", "week", "month")
+#day buckets kept (oldest dropped first), weeks / months are kept in full
+TREND_DAYS = int(os.environ.get("TREND_DAYS", 400))
+SUM_DIGITS = 9
+
+
+def trends_ref(db, uid):
+    return db.collection('users').document(uid).collection('stats').document('trends')
+
+
+def empty_series():
+    return {'keys': [], 'count': [], 'sums': {field: [] for field in STAT_FIELDS}, 'emotions': {}}
+
+
+def empty_trends():
+    return {granularity: empty_series() for granularity in GRANULARITIES}
+
+
+#YYYY-MM-DD -> bucket key per granularity (ISO weeks, eg 2024-W01)
+@lru_cache(maxsize=4096)
+def bucket_keys(date):
+    year, week, _ = Date.fromisoformat(date).isocalendar()
+    return {'day': date, 'week': f"{year}-W{week:02d}", 'month': date[:7]}
+
+
+def _columns(series):
+    return [series['count'], *series['sums'].values(), *series['emotions'].values()]
+
+
+def _insert(series, i, key):
+    series['keys'].insert(i, key)
+    series['count'].insert(i, 0)
+    for column in series['sums'].values():
+        column.insert(i, 0.0)
+    for column in series['emotions'].values():
+        column.insert(i, 0)
+
+
+def _remove(series, i):
+    series['keys'].pop(i)
+    for column in _columns(series):
+        column.pop(i)
+    for emotion in [e for e, column in series['emotions'].items() if not any(column)]:
+        del series['emotions'][emotion]
+
+
+def _apply(series, key, analysis, sign, max_buckets=None):
+    keys = series['keys']
+    i = bisect.bisect_left(keys, key)
+    if i == len(keys) or keys[i] != key:
+        if sign < 0: #bucket already aged out
+            return
+        _insert(series, i, key)
+
+    series['count'][i] += sign
+    for field in STAT_FIELDS:
+        column = series['sums'][field]
+        column[i] = round(column[i] + sign * float(analysis.get(field, 0.0)), SUM_DIGITS)
+
+    emotion = analysis.get('Emotion')
+    if emotion:
+        column = series['emotions'].setdefault(emotion, [0] * len(keys))
+        column[i] += sign
+        if sign < 0 and not any(column):
+            del series['emotions'][emotion]
+
+    if series['count'][i] <= 0:
+        _remove(series, i)
+    while max_buckets and len(keys) > max_buckets:
+        _remove(series, 0)
+
+
+#add (sign=1) or remove (sign=-1) one journal's analysis in every granularity
+def apply_journal(trends, journal, sign):
+    analysis = journal.get('analysis')
+    date = journal.get('date')
+    if not isinstance(analysis, dict) or not date: #pending / failed analyses are not counted yet
+        return
+
+    for granularity, key in bucket_keys(date).items():
+        _apply(trends[granularity], key, analysis, sign, TREND_DAYS if granularity == 'day' else None)
+
+
+def build_trends(journal_docs):
+    trends = empty_trends()
+    for doc in journal_docs:
+        if doc.id != 'init_journal':
+            apply_journal(trends, doc.to_dict(), 1)
+    return trends
+
+
+#inside a summary transaction (rebuilt from the journals for users that predate the trends doc)
+def load_trends(transaction, db, uid):
+    snapshot = trends_ref(db, uid).get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict()
+    return build_trends(transaction.get(journals_query(db, uid)))
+
+
+#one-off build for users that predate the trends doc, in a transaction so a summary transaction
+#committing meanwhile makes it retry (and find the trends that write stored) instead of being overwritten
+@firestore.transactional
+def _init_from_journals(transaction, db, uid):
+    snapshot = trends_ref(db, uid).get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict()
+    trends = build_trends(transaction.get(journals_query(db, uid)))
+    transaction.set(trends_ref(db, uid), trends)
+    return trends
+
+
+@timed("firestore.trends.get")
+def get_trends(db, uid):
+    snapshot = trends_ref(db, uid).get()
+    if snapshot.exists:
+        return snapshot.to_dict()
+    return _init_from_journals(db.transaction(), db, uid)
+
+
+#one granularity for the api: keys in [start, end] with counts, means and emotion counts
+def trend_series(trends, granularity, start=None, end=None):
+    series = trends.get(granularity) or empty_series()
+    keys = series['keys']
+    lo = bisect.bisect_left(keys, start) if start else 0
+    hi = bisect.bisect_right(keys, end) if end else len(keys)
+
+    counts = series['count'][lo:hi]
+    return {
+        'granularity': granularity,
+        'keys': keys[lo:hi],
+        'count': counts,
+        'means': {field: [s / n if n else None for s, n in zip(series['sums'][field][lo:hi], counts)]
+                  for field in STAT_FIELDS},
+        'emotions': {emotion: column[lo:hi] for emotion, column in series['emotions'].items()
+                     if any(column[lo:hi])},
+    }
@@ -0,0 +1,21 @@
+import os
+
+
+#gunicorn -c gunicorn.conf.py app:app
+#threaded workers: each request gets its own thread, so a request blocked on firestore / gemini /
+#spotify doesn't hold up the others (raise WEB_THREADS for more concurrent slow requests per worker).
+#caches and work queues are per process, so the app is not preloaded before forking
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_WORKERS", 2))
+threads = int(os.environ.get("WEB_THREADS", 16))
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+#background jobs that must not start as a side effect of importing the app (tests, bench, scripts)
+def post_worker_init(worker):
+    from app import start_pending_sweep
+    start_pending_sweep()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#tests import the app's modules the same way app.py does (from database..., from utils...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,76 @@
+import random
+import pytest
+from utils.llms.context import (journal_context, summarize_journal, estimate_tokens, PROMPT_JOURNAL_TOKENS,
+                                JOURNAL_SUMMARY_TOKENS)
+
+WORDS = ("today i felt calm tired happy stressed about exams but my friends helped and the rain made work "
+         "slow so i went for a walk listened to music slept early and feel proud lonely hopeful").split()
+
+
+def sentences(rng, count):
+    return " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))).capitalize() + "."
+                    for _ in range(count))
+
+
+#newest first, like the summary's recent list
+def journals(rng, count, length):
+    return [{'date': f"2024-03-{28 - i:02d}", 'title': f"day {i}", 'content': sentences(rng, length)}
+            for i in range(count)]
+
+
+def test_short_journal_needs_no_summary():
+    assert summarize_journal("Slept well. Went for a walk.") is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_summary_fits_its_budget(seed):
+    content = sentences(random.Random(seed), 60)
+    summary = summarize_journal(content)
+    assert summary and estimate_tokens(summary) <= JOURNAL_SUMMARY_TOKENS + 1 #+1 for the ellipsis / joins
+    assert all(sentence.strip() in content for sentence in summary.rstrip("…").split(". ") if sentence.strip())
+
+
+def test_one_run_on_sentence_is_truncated():
+    summary = summarize_journal(" ".join(["word"] * 400))
+    assert summary.endswith("…") and estimate_tokens(summary) <= JOURNAL_SUMMARY_TOKENS + 1
+
+
+@pytest.mark.parametrize("seed, count, length", [(0, 5, 3), (1, 5, 30), (2, 5, 80), (3, 1, 400), (4, 12, 40)])
+def test_context_stays_within_budget(seed, count, length):
+    context = journal_context(journals(random.Random(seed), count, length))
+    assert context
+    assert estimate_tokens(context) <= PROMPT_JOURNAL_TOKENS + count #+ the newlines between entries
+
+
+def test_everything_verbatim_when_it_fits():
+    entries = journals(random.Random(5), 3, 3)
+    context = journal_context(entries)
+    for journal in entries:
+        assert journal['content'] in context
+    assert "(summary)" not in context
+    assert context.index("day 2") < context.index("day 0") #oldest first
+
+
+def test_newest_keeps_full_text_older_fall_back_to_summaries():
+    entries = journals(random.Random(6), 5, 40)
+    newest = entries[0]
+    assert estimate_tokens(newest['content']) < PROMPT_JOURNAL_TOKENS
+    context = journal_context(entries)
+
+    assert context.endswith(newest['content'])
+    assert f"{newest['date']} - {newest['title']}\n" in context
+    assert "(summary)" in context
+
+
+def test_oldest_dropped_first():
+    entries = journals(random.Random(7), 12, 60)
+    context = journal_context(entries, budget=300)
+    assert estimate_tokens(context) <= 300 + len(entries)
+    assert entries[0]['title'] in context
+    assert entries[-1]['title'] not in context
+
+
+def test_single_oversized_entry_is_truncated():
+    entries = [{'date': '2024-03-01', 'title': 'long', 'content': " ".join(["word"] * 3000)}]
+    context = journal_context(entries, budget=100)
+    assert estimate_tokens(context) <= 100 + estimate_tokens("2024-03-01 - long (summary)\n")
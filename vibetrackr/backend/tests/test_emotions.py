@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from utils.ml.emotions import EMOTION_VAD, classify_emotion, classify_emotions, vibescore, vibescores
+
+
+def tie_rows():
+    #rows at the same angle from two prototypes, so the first prototype in EMOTION_VAD has to win
+    names = [name for name in EMOTION_VAD if name != "Neutral"]
+    rows = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            ua = EMOTION_VAD[a] / np.linalg.norm(EMOTION_VAD[a])
+            ub = EMOTION_VAD[b] / np.linalg.norm(EMOTION_VAD[b])
+            rows.append(ua + ub)
+    return rows
+
+
+def edge_rows():
+    #exact prototypes (incl. the all zero Neutral one), scaled / flipped prototypes and tiny rows
+    rows = [np.zeros(3), np.full(3, 1e-12)]
+    for prototype in EMOTION_VAD.values():
+        rows += [prototype, prototype * 3.5, -prototype]
+    return rows
+
+
+def random_rows(n=2000, seed=7):
+    rng = np.random.default_rng(seed)
+    return list(rng.uniform(-1, 1, size=(n, 3)))
+
+
+@pytest.mark.parametrize("rows", [random_rows(), edge_rows(), tie_rows()], ids=["random", "edges", "ties"])
+def test_classify_emotions_matches_per_row(rows):
+    emotions, dists = classify_emotions(np.array(rows))
+
+    assert len(emotions) == len(rows)
+    for row, emotion, dist in zip(rows, emotions, dists):
+        expected_emotion, expected_dist = classify_emotion(row)
+        assert emotion == expected_emotion, row
+        assert dist == pytest.approx(expected_dist, abs=1e-6), row
+
+
+def test_classify_emotions_zero_row_picks_first_prototype():
+    #every similarity is 0 for an all zero row, the loop keeps the first one it sees
+    emotions, dists = classify_emotions(np.zeros((1, 3)))
+    assert emotions[0] == classify_emotion([0, 0, 0])[0] == next(iter(EMOTION_VAD))
+    assert dists[0] == pytest.approx(classify_emotion([0, 0, 0])[1])
+
+
+def test_classify_emotions_never_picks_neutral_for_nonzero_rows():
+    #Neutral's prototype is all zeros so its similarity is 0, some other prototype always scores higher
+    emotions, _ = classify_emotions(np.array(random_rows(500, seed=11)))
+    assert "Neutral" not in set(emotions)
+    assert all(classify_emotion(row)[0] != "Neutral" for row in random_rows(500, seed=11))
+
+
+def test_classify_emotions_single_row():
+    row = [0.3, -0.2, 0.5]
+    emotions, dists = classify_emotions(row)
+    assert (emotions[0], dists[0]) == pytest.approx(classify_emotion(row))
+
+
+@pytest.mark.parametrize("rows", [random_rows(), edge_rows()], ids=["random", "edges"])
+def test_vibescores_matches_per_row(rows):
+    scores = vibescores(np.array(rows))
+
+    assert len(scores) == len(rows)
+    for row, score in zip(rows, scores):
+        assert score == pytest.approx(vibescore(*row), rel=1e-12, abs=1e-15)
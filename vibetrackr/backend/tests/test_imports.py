@@ -0,0 +1,40 @@
+import time
+import importlib
+import pytest
+from firebase_admin import firestore
+from bench.fakes import FakeFirestore, FakeVADBackend, fake_transactional
+from utils.ml import query_api_bert
+
+ENTRIES = [{'content': f"entry {i}", 'timestamp': 1704200000 + i} for i in range(3)]
+
+
+@pytest.fixture
+def imports(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    monkeypatch.setattr(query_api_bert, "vad_backend", FakeVADBackend())
+    from database import summary, imports
+    importlib.reload(summary)
+    return importlib.reload(imports)
+
+
+def test_in_flight_job_is_not_resumed(imports):
+    db = FakeFirestore()
+    imports.create_job(db, 'u1', 'j1', len(ENTRIES))
+    assert imports.resume_job(db, 'u1', 'j1') is None
+
+
+#worker killed mid-import: fail_import never ran and the job is stuck in running
+def test_abandoned_job_is_resumed_once_by_a_new_run(imports):
+    db = FakeFirestore()
+    job = imports.create_job(db, 'u1', 'j1', len(ENTRIES))
+    imports.imports_ref(db, 'u1').document('j1').update(
+        {'status': 'running', 'updated_at': time.time() - imports.IMPORT_LEASE - 1})
+
+    resumed = imports.resume_job(db, 'u1', 'j1')
+    assert resumed['status'] == 'queued' and resumed['run'] != job['run']
+    assert imports.resume_job(db, 'u1', 'j1') is None
+
+    assert imports.run_import(db, 'u1', 'j1', ENTRIES, 'UTC', job['run']) is False #superseded
+    assert imports.run_import(db, 'u1', 'j1', ENTRIES, 'UTC', resumed['run']) is True
+    done = imports.get_job(db, 'u1', 'j1')
+    assert (done['status'], done['processed'], done['imported']) == ('done', 3, 3)
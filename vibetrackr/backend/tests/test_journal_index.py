@@ -0,0 +1,39 @@
+from utils.ml.embeddings import HashingEmbedder
+from utils.ml.journal_index import JournalIndex
+
+
+def journal(journal_id, content):
+    return {'id': journal_id, 'title': '', 'content': content, 'timestamp': 0, 'date': '2024-01-01'}
+
+
+#two hosts share firestore but each has its own shard directory
+def test_shard_written_elsewhere_is_rebuilt(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    host_a = JournalIndex(str(tmp_path / "a"), embedder)
+    host_b = JournalIndex(str(tmp_path / "b"), embedder)
+    journals = [journal('j1', 'long run by the river')]
+
+    host_a.ensure('u1', lambda: journals, version=1)
+    host_b.ensure('u1', lambda: journals, version=1)
+
+    #host b handles the next write (text_version 2), host a never hears about it
+    journals.append(journal('j2', 'baking bread with grandma'))
+    host_b.upsert('u1', 'j2', journals[-1], version=2)
+
+    host_b.ensure('u1', lambda: [], version=2) #in step, no rebuild
+    assert [hit for hit, _ in host_b.search('u1', 'bread')][:1] == ['j2']
+
+    host_a.ensure('u1', lambda: journals, version=2)
+    assert [hit for hit, _ in host_a.search('u1', 'bread')][:1] == ['j2']
+
+
+def test_out_of_order_write_forces_rebuild(tmp_path):
+    index = JournalIndex(str(tmp_path), HashingEmbedder(dim=64))
+    journals = [journal('j1', 'quiet morning coffee')]
+    index.rebuild('u1', journals, version=1)
+
+    #version 2 was written on another instance, this one only sees version 3
+    index.upsert('u1', 'j3', journal('j3', 'thunderstorm all night'), version=3)
+    rebuilt = []
+    index.ensure('u1', lambda: rebuilt.append(1) or journals, version=3)
+    assert rebuilt == [1]
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+from bench.fakes import FakeFirestore, FakeBulkWriter
+from database import reanalyze
+from database.queries import journals_ref
+
+
+#bulk writer whose writes to some paths keep failing (after the bulk writer's own retries)
+class FlakyBulkWriter(FakeBulkWriter):
+
+    def __init__(self, db, failing):
+        super().__init__(db)
+        self.failing = failing
+        self.callback = None
+
+    def on_write_error(self, callback):
+        self.callback = callback
+
+    def update(self, ref, data, option=None):
+        if ref.path not in self.failing:
+            return super().update(ref, data, option)
+        for attempt in range(1, reanalyze.WRITE_ATTEMPTS + 1):
+            failure = SimpleNamespace(code=14, attempts=attempt, operation=SimpleNamespace(reference=ref))
+            if not self.callback(failure):
+                return
+
+
+def seed(db, count=6):
+    for i in range(count):
+        journals_ref(db, 'u1').document(f"j{i}").set({'content': 'x', 'analysis': {'Raw_VAD': [4.0, 2.0, 3.0]}})
+
+
+def run(db, checkpoint):
+    checkpoint.start([[None, None]])
+    reanalyze.run_partition(db, checkpoint, 0, page_size=4, log=lambda message: None)
+    return checkpoint.totals()
+
+
+def test_failed_writes_are_not_counted_and_retried_on_resume(tmp_path):
+    db = FakeFirestore()
+    seed(db)
+    failing = {journals_ref(db, 'u1').document('j2').path}
+    db.bulk_writer = lambda **kwargs: FlakyBulkWriter(db, failing)
+
+    path = str(tmp_path / "checkpoint.json")
+    totals = run(db, reanalyze.Checkpoint(path))
+    assert (totals['updated'], totals['failed']) == (5, 1)
+    assert 'Raw_VAD' in journals_ref(db, 'u1').document('j2').get().to_dict()['analysis']
+    assert 'V' not in journals_ref(db, 'u1').document('j2').get().to_dict()['analysis']
+
+    failing.clear() #resumed run: the listed write goes through this time
+    resumed = reanalyze.Checkpoint(path)
+    assert resumed.failed == [sorted({journals_ref(db, 'u1').document('j2').path})]
+    totals = run(db, resumed)
+    assert (totals['read'], totals['updated'], totals['failed']) == (6, 6, 0)
+    assert 'V' in journals_ref(db, 'u1').document('j2').get().to_dict()['analysis']
+    assert reanalyze.Checkpoint(path).failed == [[]]
@@ -0,0 +1,108 @@
+import pytest
+from types import SimpleNamespace
+from utils.llms import prompts
+from utils.llms.structured import (StructuredOutputError, parse_genres, parse_mood_mentor, parse_mentor_issue,
+                                   generate_structured)
+
+ISSUE = {"issue": "Stress", "steps": ["walk"], "therapies": ["CBT"], "sources": ["https://example.org"]}
+ISSUE_JSON = {"Stress": {"Steps": ["walk"], "Therapies": ["CBT"], "Sources": ["https://example.org"]}}
+
+
+@pytest.mark.parametrize("text, genres", [
+    ('["Lo-Fi", "Jazz"]', ["lo-fi", "jazz"]),
+    ('```json\n["lo-fi", "jazz"]\n```', ["lo-fi", "jazz"]),
+    ('["lo-fi, jazz, Lo-Fi"]', ["lo-fi", "jazz"]), #old single-string format, deduplicated
+    ('{"genres": ["ambient"]}', ["ambient"]),
+    ("Sure! ['ambient', 'piano']", ["ambient", "piano"]), #python literal
+    ('Here are [3] picks: ["ambient", "piano", "folk"]', ["ambient", "piano", "folk"]),
+    ('I thought about {mood} first. ["folk"]', ["folk"]),
+])
+def test_parse_genres(text, genres):
+    assert parse_genres(text) == genres
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "[]", "[3]", '{"other": 1}', '["", " "]'])
+def test_parse_genres_rejects(text):
+    with pytest.raises(StructuredOutputError):
+        parse_genres(text)
+
+
+@pytest.mark.parametrize("value, issue", [
+    (ISSUE, "Stress"),
+    ({"Stress": {"Steps": ["walk"], "Therapies": ["CBT"], "Sources": []}}, "Stress"), #old shape
+    ({"issue": " Sleep "}, "Sleep"), #missing lists default to empty, name stripped
+    ({"issue": "  "}, None),
+    ({"issue": "Stress", "steps": "walk"}, None),
+    ("Stress", None),
+])
+def test_parse_mentor_issue(value, issue):
+    parsed = parse_mentor_issue(value)
+    assert (parsed.issue if parsed else None) == issue
+
+
+@pytest.mark.parametrize("text, count", [
+    ('[{"issue": "Stress", "steps": ["walk"], "therapies": ["CBT"], "sources": ["https://example.org"]}]', 1),
+    ('{"issues": [{"issue": "A"}, {"issue": "B"}]}', 2),
+    ('{"issue": "Alone"}', 1),
+    ('[{"issue": "A"}, {"issue": ""}]', 1), #invalid items dropped
+    ('I found [2] issues: [{"issue": "A"}, {"issue": "B"}]', 2),
+    ("[]", 0),
+])
+def test_parse_mood_mentor(text, count):
+    assert len(parse_mood_mentor(text)) == count
+
+
+@pytest.mark.parametrize("text", ["nothing", "[3]", '[{"issue": ""}]', '"just a string"'])
+def test_parse_mood_mentor_rejects(text):
+    with pytest.raises(StructuredOutputError):
+        parse_mood_mentor(text)
+
+
+#gemini stand-in: generate_content replies in order, generate_content_stream streams one reply in chunks
+class ScriptedClient:
+
+    def __init__(self, replies, stream=""):
+        self.replies = list(replies)
+        self.prompts = []
+        self.models = SimpleNamespace(generate_content=self.generate, generate_content_stream=self.stream)
+        self._stream = stream
+
+    def generate(self, model, contents, config=None):
+        self.prompts.append(contents)
+        return SimpleNamespace(text=self.replies.pop(0))
+
+    def stream(self, model, contents, config=None):
+        for i in range(0, len(self._stream), 7):
+            yield SimpleNamespace(text=self._stream[i:i + 7])
+
+
+def test_generate_structured_reasks_once():
+    client = ScriptedClient(["no idea", '["jazz"]'])
+    assert generate_structured("prompt", client, None, parse_genres, reasks=1) == ["jazz"]
+    assert len(client.prompts) == 2 and client.prompts[1].startswith("prompt")
+
+
+def test_generate_structured_gives_up():
+    client = ScriptedClient(["no idea", "still no idea"])
+    with pytest.raises(StructuredOutputError):
+        generate_structured("prompt", client, None, parse_genres, reasks=1)
+
+
+@pytest.mark.parametrize("stream, replies, expected", [
+    ('[{"issue": "Stress", "steps": ["walk"], "therapies": ["CBT"], "sources": ["https://example.org"]}]', [], [ISSUE_JSON]),
+    ("Sorry, I can't help with that.", ['[{"issue": "Stress", "steps": ["walk"], "therapies": ["CBT"], "sources": ["https://example.org"]}]'], [ISSUE_JSON]),
+    ('Here are [3] issues: [{"issue": "Stress"}]', ['[{"issue": "Stress", "steps": ["walk"], "therapies": ["CBT"], "sources": ["https://example.org"]}]'], [ISSUE_JSON]),
+    ("[]", [], []),
+])
+def test_stream_mood_mentor_falls_back_before_sending(stream, replies, expected):
+    client = ScriptedClient(replies, stream=stream)
+    assert list(prompts.stream_mood_mentor("journals", client)) == expected
+    assert client.replies == [] #the non-streamed query ran exactly when expected
+
+
+def test_stream_mood_mentor_fails_after_sending():
+    client = ScriptedClient([], stream='[{"issue": "Stress"}, {"issue": ')
+    issues = prompts.stream_mood_mentor("journals", client)
+    assert next(issues) == {"Stress": {"Steps": [], "Therapies": [], "Sources": []}}
+    with pytest.raises(StructuredOutputError):
+        next(issues)
@@ -0,0 +1,87 @@
+import importlib
+import pytest
+from firebase_admin import firestore
+from bench.fakes import FakeFirestore, fake_transactional
+from database.queries import journals_ref
+
+ANALYSIS = {'V': 0.1, 'A': 0.2, 'D': 0.3, 'Valence_Scaled_By_Mag': 0.1, 'Emotion': 'Happy'}
+
+
+@pytest.fixture
+def summary(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    from database import summary
+    return importlib.reload(summary) #re-decorate the transactions with the fake
+
+
+def add(summary, db, journal_id, timestamp=1):
+    ref = journals_ref(db, 'u1').document(journal_id)
+    summary.add_journal_entry(db, 'u1', ref, {'content': 'x', 'timestamp': timestamp, 'date': '2024-01-01',
+                                              'analysis': dict(ANALYSIS)})
+
+
+#google sign-in calls /create-user again for existing accounts
+def test_init_summary_keeps_existing_docs(summary):
+    db = FakeFirestore()
+    summary.init_summary(db, 'u1')
+    add(summary, db, 'j1')
+    summary.init_summary(db, 'u1')
+
+    stored = summary.get_summary(db, 'u1')
+    assert stored['count'] == 1
+    assert stored['emotions'] == {'Happy': 1}
+    assert summary.trends_ref(db, 'u1').get().to_dict()['day']['count'] == [1]
+
+
+#running sums stay equal to a rebuild after many adds / deletes (no float residue)
+def test_sums_match_rebuild_after_writes(summary):
+    db = FakeFirestore()
+    summary.init_summary(db, 'u1')
+    for i in range(50):
+        add(summary, db, f"j{i}", timestamp=i)
+    for i in range(0, 50, 3):
+        summary.delete_journal_entry(db, 'u1', journals_ref(db, 'u1').document(f"j{i}"))
+
+    stored = summary.get_summary(db, 'u1')
+    rebuilt = summary.build_summary(journals_ref(db, 'u1').stream())
+    assert stored['sums'] == rebuilt['sums']
+    assert stored['count'] == rebuilt['count'] == 33
+
+
+#users from before the summary doc get it built (and stored) on first read
+def test_get_summary_builds_missing_doc(summary):
+    db = FakeFirestore()
+    for i in range(3):
+        journals_ref(db, 'u1').document(f"j{i}").set({'content': 'x', 'timestamp': i, 'date': '2024-01-01',
+                                                       'analysis': dict(ANALYSIS)})
+
+    built = summary.get_summary(db, 'u1')
+    assert built['count'] == 3
+    assert summary.summary_ref(db, 'u1').get().to_dict() == built
+
+
+#a journal written between the rebuild's scan and its write must not be dropped
+def test_rebuild_rescans_when_a_write_lands_meanwhile(summary, monkeypatch):
+    db = FakeFirestore()
+    summary.init_summary(db, 'u1')
+    add(summary, db, 'j1')
+
+    real_journals_ref = summary.journals_ref
+    scans = []
+
+    class RacingJournals:
+        def __init__(self, db, uid):
+            self.ref = real_journals_ref(db, uid)
+
+        def stream(self):
+            docs = list(self.ref.stream())
+            if not scans:
+                add(summary, db, 'j2', timestamp=2) #commits after the scan, before the rebuild is stored
+            scans.append(len(docs))
+            return docs
+
+    monkeypatch.setattr(summary, "journals_ref", RacingJournals)
+    rebuilt = summary.rebuild_summary(db, 'u1')
+    assert scans == [1, 2]
+    assert rebuilt['count'] == 2
+    assert rebuilt['text_version'] == 3 #init 0, two adds, one rebuild
@@ -0,0 +1,121 @@
+import random
+import importlib
+import pytest
+from firebase_admin import firestore
+from bench.fakes import FakeFirestore, fake_transactional
+from database import trends
+from database.trends import apply_journal, build_trends, empty_trends, GRANULARITIES, STAT_FIELDS
+
+EMOTIONS = ["Sad", "Happy", "Pessimistic", "Calm", "Angry"]
+
+
+class Doc:
+
+    def __init__(self, journal_id, data):
+        self.id = journal_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def random_journal(rng):
+    analysis = {field: rng.uniform(-1, 1) for field in STAT_FIELDS}
+    analysis['Emotion'] = rng.choice(EMOTIONS)
+    if rng.random() < 0.1:
+        analysis = rng.choice(['pending', 'failed'])
+    return {'date': f"2024-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d}", 'analysis': analysis}
+
+
+def assert_same_trends(actual, expected):
+    for granularity in GRANULARITIES:
+        a, e = actual[granularity], expected[granularity]
+        assert a['keys'] == e['keys'], granularity
+        assert a['count'] == e['count'], granularity
+        assert a['emotions'] == e['emotions'], granularity
+        for field in STAT_FIELDS:
+            assert a['sums'][field] == pytest.approx(e['sums'][field], abs=1e-6), (granularity, field)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_updates_match_rebuild(seed):
+    rng = random.Random(seed)
+    journals = {}
+    state = empty_trends()
+
+    for step in range(300):
+        op = rng.random()
+        if op < 0.5 or not journals:
+            journal_id = f"j{step}"
+            journals[journal_id] = random_journal(rng)
+            apply_journal(state, journals[journal_id], 1)
+        elif op < 0.75:
+            journal_id = rng.choice(list(journals))
+            new = random_journal(rng)
+            apply_journal(state, journals[journal_id], -1)
+            apply_journal(state, new, 1)
+            journals[journal_id] = new
+        else:
+            journal_id = rng.choice(list(journals))
+            apply_journal(state, journals.pop(journal_id), -1)
+
+        if step % 25 == 0:
+            assert_same_trends(state, build_trends(Doc(k, v) for k, v in journals.items()))
+
+    assert_same_trends(state, build_trends(Doc(k, v) for k, v in journals.items()))
+
+
+def test_removed_emotions_leave_no_zero_columns():
+    sad = {'date': '2024-01-01', 'analysis': {'V': 0.5, 'A': 0.1, 'D': 0.2, 'Valence_Scaled_By_Mag': 0.3, 'Emotion': 'Sad'}}
+    gloomy = {'date': '2024-01-01', 'analysis': {**sad['analysis'], 'Emotion': 'Pessimistic'}}
+    state = empty_trends()
+    apply_journal(state, sad, 1)
+    apply_journal(state, gloomy, 1)
+    apply_journal(state, gloomy, -1)
+
+    assert state == build_trends([Doc('a', sad)])
+    assert 'Pessimistic' not in state['day']['emotions']
+
+
+#same check through the summary transactions (add / update / delete) against the stored trends doc
+def test_summary_writes_keep_trends_doc_in_sync(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    from database import summary
+    summary = importlib.reload(summary) #re-decorate the transactions with the fake
+    from database.queries import journals_ref
+
+    rng = random.Random(7)
+    db = FakeFirestore()
+    summary.init_summary(db, 'u1')
+    ids = []
+    for step in range(120):
+        op = rng.random()
+        if op < 0.55 or not ids:
+            ref = journals_ref(db, 'u1').document(f"j{step}")
+            summary.add_journal_entry(db, 'u1', ref, {**random_journal(rng), 'timestamp': step, 'content': 'x'})
+            ids.append(ref.id)
+        elif op < 0.8:
+            ref = journals_ref(db, 'u1').document(rng.choice(ids))
+            summary.update_journal_entry(db, 'u1', ref, {**random_journal(rng), 'timestamp': step})
+        else:
+            journal_id = ids.pop(rng.randrange(len(ids)))
+            summary.delete_journal_entry(db, 'u1', journals_ref(db, 'u1').document(journal_id))
+
+    stored = trends.trends_ref(db, 'u1').get().to_dict()
+    assert_same_trends(stored, build_trends(journals_ref(db, 'u1').stream()))
+
+
+#users from before the trends doc get it built (and stored) on first read
+def test_get_trends_builds_missing_doc(monkeypatch):
+    monkeypatch.setattr(firestore, "transactional", fake_transactional)
+    reloaded = importlib.reload(trends)
+    from database.queries import journals_ref
+
+    rng = random.Random(3)
+    db = FakeFirestore()
+    for i in range(30):
+        journals_ref(db, 'u1').document(f"j{i}").set({**random_journal(rng), 'timestamp': i})
+
+    built = reloaded.get_trends(db, 'u1')
+    assert_same_trends(built, build_trends(journals_ref(db, 'u1').stream()))
+    assert reloaded.trends_ref(db, 'u1').get().to_dict() == built
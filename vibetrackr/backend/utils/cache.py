@@ -0,0 +1,184 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+#in-process lru cache with size + ttl eviction (thread safe, shared by the api workers)
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    #ttl overrides the cache default for this entry (eg tokens that expire at a known time)
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+#optional persistent tier so warm restarts / other workers on the box keep their hits
+class SQLiteCache:
+
+    def __init__(self, path, table="cache", ttl=None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._local = threading.local()
+
+        with self._conn() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute(f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+
+        value, expires = row
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return default
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else None
+
+        with self._conn() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                         (key, json.dumps(value), expires))
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+
+#memory first, then the persistent tier (promoting hits back into memory)
+class TieredCache:
+
+    def __init__(self, memory, persistent=None):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        if self.persistent is not None:
+            self.persistent.set(key, value, ttl)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+
+#build a memory (+ optional sqlite) cache from settings
+def make_cache(maxsize=1024, ttl=None, path=None, table="cache"):
+    persistent = SQLiteCache(path, table=table, ttl=ttl) if path else None
+    return TieredCache(LRUCache(maxsize=maxsize, ttl=ttl), persistent)
+
+
+#stale-while-revalidate: entries older than fresh_ttl are still served (up to max_age) while one
+#background fetch refreshes them, so hot keys never block a request on the upstream api
+class StaleWhileRevalidate:
+
+    def __init__(self, cache, workers=2):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="revalidate")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _store(self, key, value, max_age):
+        self.cache.set(key, [time.time(), value], ttl=max_age)
+
+    def _refresh(self, key, fetch, max_age):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._store(key, fetch(), max_age)
+            except Exception:
+                pass #keep serving the stale value, the next read retries
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def get(self, key, fetch, fresh_ttl, max_age):
+        entry = self.cache.get(key)
+        if entry is not None and time.time() - entry[0] < max_age:
+            fetched_at, value = entry
+            if time.time() - fetched_at >= fresh_ttl:
+                self._refresh(key, fetch, max_age)
+            return value
+
+        value = fetch()
+        self._store(key, value, max_age)
+        return value
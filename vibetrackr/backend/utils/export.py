@@ -0,0 +1,31 @@
+import json
+import zlib
+
+
+#chunk generators for streaming journal exports, documents are serialized as they arrive
+
+def ndjson_chunks(docs):
+    for doc in docs:
+        yield json.dumps(doc, default=str) + "\n"
+
+
+#a normal json array, written incrementally
+def json_array_chunks(docs):
+    yield "["
+    first = True
+    for doc in docs:
+        yield ("" if first else ",") + json.dumps(doc, default=str)
+        first = False
+    yield "]"
+
+
+#gzip a chunk stream, flushing every few chunks so the client still gets bytes early
+def gzip_chunks(chunks, flush_every=50, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) #wbits 31 = gzip container
+    for i, chunk in enumerate(chunks, 1):
+        data = compressor.compress(chunk.encode("utf-8"))
+        if i % flush_every == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
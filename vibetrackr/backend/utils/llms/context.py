@@ -0,0 +1,86 @@
+import os
+import re
+import math
+from collections import Counter
+from utils.ml.embeddings import TOKEN_RE, STOPWORDS
+
+
+#journal text that goes into the llm prompts, kept under a token budget:
+#newest journals go in word for word, older ones fall back to a short extractive summary that is
+#computed once when the journal is written (stored as content_summary) and oldest entries are dropped
+#if even the summaries don't fit. prompts put their fixed instructions first and this block last,
+#so every call for the same prompt kind shares one stable prefix
+
+#gemini averages ~4 characters of english per token, close enough for budgeting without a tokenizer call
+CHARS_PER_TOKEN = float(os.environ.get("CHARS_PER_TOKEN", 4))
+PROMPT_JOURNAL_TOKENS = int(os.environ.get("PROMPT_JOURNAL_TOKENS", 1200))
+JOURNAL_SUMMARY_TOKENS = int(os.environ.get("JOURNAL_SUMMARY_TOKENS", 80))
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def _truncate(text, max_tokens):
+    limit = int(max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0].rstrip(",;:") + "…"
+
+
+#highest scoring sentences (frequent content words, length-normalized) in their original order
+#None when the journal is already short enough to go into prompts as is
+def summarize_journal(content, max_tokens=JOURNAL_SUMMARY_TOKENS):
+    content = (content or "").strip()
+    if estimate_tokens(content) <= max_tokens:
+        return None
+
+    sentences = [s.strip() for s in SENTENCE_RE.split(content) if s.strip()]
+    words = [[w for w in TOKEN_RE.findall(s.lower()) if w not in STOPWORDS] for s in sentences]
+    freq = Counter(w for sentence in words for w in sentence)
+
+    scores = [sum(freq[w] for w in set(sentence)) / math.sqrt(len(sentence)) if sentence else 0.0
+              for sentence in words]
+    picked, used = [], 0
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost <= max_tokens:
+            picked.append(i)
+            used += cost
+
+    if not picked: #one long run-on sentence
+        return _truncate(sentences[0], max_tokens)
+    return " ".join(sentences[i] for i in sorted(picked))
+
+
+def _header(journal, summarized):
+    header = " - ".join(part for part in (journal.get('date'), journal.get('title')) if part)
+    return f"{header} (summary)" if summarized else header
+
+
+#journals newest first (as in the summary's recent list) -> prompt block, oldest first
+def journal_context(journals, budget=PROMPT_JOURNAL_TOKENS):
+    entries = []
+    for journal in journals:
+        full = (journal.get('content') or "").strip()
+        short = journal.get('content_summary') or summarize_journal(full) or full
+        entries.append({'journal': journal, 'full': full, 'short': short, 'text': short})
+
+    #every entry starts as its summary, then newest first get their full text back while it fits
+    used = sum(estimate_tokens(e['text']) + estimate_tokens(_header(e['journal'], True)) for e in entries)
+    for entry in entries:
+        extra = estimate_tokens(entry['full']) - estimate_tokens(entry['short'])
+        if extra and used + extra <= budget:
+            entry['text'] = entry['full']
+            used += extra
+
+    while len(entries) > 1 and used > budget:
+        dropped = entries.pop()
+        used -= estimate_tokens(dropped['text']) + estimate_tokens(_header(dropped['journal'], True))
+    if entries and used > budget:
+        entries[0]['text'] = _truncate(entries[0]['text'], budget)
+
+    return "\n\n".join(f"{_header(e['journal'], e['text'] is not e['full'])}\n{e['text']}".strip()
+                       for e in reversed(entries))
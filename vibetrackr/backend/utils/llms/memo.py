@@ -0,0 +1,37 @@
+import os
+import hashlib
+from utils.cache import make_cache
+from utils.llms.query import GEMINI_MODEL
+
+
+#parsed llm responses keyed on model + prompt version + the exact prompt text (journal content, titles,
+#dates and stored summaries all end up in it, so any change to them is a new key and nothing has to be
+#invalidated on journal writes, answers for old prompts just age out of the cache)
+llm_cache = make_cache(maxsize=int(os.environ.get("LLM_CACHE_SIZE", 2000)),
+                       ttl=float(os.environ.get("LLM_CACHE_TTL", 24 * 3600)),
+                       path=os.environ.get("LLM_CACHE_PATH"),
+                       table="llm_cache")
+
+
+def prompt_digest(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def memo_key(kind, version, prompt, model=GEMINI_MODEL):
+    return f"{model}:{kind}:v{version}:{prompt_digest(prompt)}"
+
+
+def cached(key):
+    return llm_cache.get(key)
+
+
+def remember(key, value):
+    llm_cache.set(key, value)
+
+
+def memoize(key, compute):
+    value = cached(key)
+    if value is None:
+        value = compute()
+        remember(key, value)
+    return value
@@ -1,53 +1,67 @@
-from utils.llms.query import make_query, make_client
+from utils.llms.query import make_query_stream, make_client
+from utils.llms.stream_json import iter_json_array_items
+from utils.llms.structured import (GENRES_CONFIG, MENTOR_CONFIG, StructuredOutputError, generate_structured,
+                                   parse_genres, parse_mood_mentor, parse_mentor_issue)
 import os
 import math
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-import json
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import make_cache, StaleWhileRevalidate
+from utils.metrics import timed
 
 
 #make prompting + response parsing for spotify music recommendations
 
+#spotify lookups fan out over this pool and share one pooled http session
+SPOTIFY_WORKERS = int(os.environ.get("SPOTIFY_WORKERS", 8))
+spotify_executor = ThreadPoolExecutor(max_workers=SPOTIFY_WORKERS, thread_name_prefix="spotify")
+
+#genre searches + artist top tracks change slowly and are shared by every user
+#(seconds: served fresh until *_FRESH, then served stale + refreshed in the background until *_MAX_AGE)
+SPOTIFY_SEARCH_FRESH = float(os.environ.get("SPOTIFY_SEARCH_FRESH", 24 * 3600))
+SPOTIFY_SEARCH_MAX_AGE = float(os.environ.get("SPOTIFY_SEARCH_MAX_AGE", 7 * 24 * 3600))
+SPOTIFY_TRACKS_FRESH = float(os.environ.get("SPOTIFY_TRACKS_FRESH", 12 * 3600))
+SPOTIFY_TRACKS_MAX_AGE = float(os.environ.get("SPOTIFY_TRACKS_MAX_AGE", 3 * 24 * 3600))
+spotify_cache = StaleWhileRevalidate(make_cache(maxsize=int(os.environ.get("SPOTIFY_CACHE_SIZE", 5000)),
+                                                path=os.environ.get("SPOTIFY_CACHE_PATH"),
+                                                table="spotify_cache"))
+
 def get_spotify_client():
-    return spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=os.environ.get("Spotifyid"), client_secret=os.environ.get("Spotifysecret")))
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=SPOTIFY_WORKERS, pool_maxsize=SPOTIFY_WORKERS))
+    return spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=os.environ.get("Spotifyid"), client_secret=os.environ.get("Spotifysecret")),
+                           requests_session=session)
 
-def get_spotify_recs(journals, gai_client, sp):
-    
-    prompt = f"""
-        You are a music therapist AI. A person writes journals every day. Here are their latest journals: "{journals}".
-        Suggest 3 music genres that could help to improve or maintain their mood and well-being depending on if they are doing not well or well. Your are the judge. Be specific. These genres must be spotify approved genres.
-        Example format: "[genre1, genre2, genre3]". DO NOT INCLUDE ANY OTHER INFORMATION OTHER THAN WHAT IS SHOWN IN THE EXAMPLE.
-    """
-    genres = json.loads(make_query(prompt, gai_client).text.strip().lower())[0].split(', ')
-
-    max_total_tracks = 20
+
+#pick tracks in genre order with the per-genre / per-artist / no repeated artist rules
+#yields an artist id whenever it needs that artist's top tracks and expects them sent back,
+#so the top track lookups can be fetched ahead on the spotify thread pool
+def assemble_tracks(genres, artists_by_genre, max_total_tracks=20, max_tracks_per_artist=2):
     tracks_per_genre = math.ceil(max_total_tracks / len(genres))
 
     final_tracks = []
     artists_seen = set()
 
-    for genre in genres: #go through llm genres
-        artists_results = sp.search(q=f'genre:"{genre}"', type='artist', limit=10)
-        artists = artists_results['artists']['items']
-        
-        genre_tracks_collected = 0 
-        
+    for genre, artists in zip(genres, artists_by_genre): #go through llm genres
+        genre_tracks_collected = 0
+
         for artist in artists:#find the top artists in the genre that actually have enough tracks
-            if genre_tracks_collected >= tracks_per_genre:
+            if genre_tracks_collected >= tracks_per_genre or len(final_tracks) >= max_total_tracks:
                 break
-            
+
             if artist['id'] in artists_seen: #make sure artists are not repeated other than for max number of tracks per artist
                 continue
-            
-            top_tracks = sp.artist_top_tracks(artist['id'], country='US')['tracks']
-            
-            max_tracks_per_artist = 2
-            
+
+            top_tracks = yield artist['id']
+
             for track in top_tracks[:max_tracks_per_artist]:
                 if genre_tracks_collected >= tracks_per_genre:
                     break
 
-                final_tracks.append({ #compose tracks 
+                final_tracks.append({ #compose tracks
                     'track_name': track['name'],
                     'artist_name': artist['name'],
                     'genre': genre,
@@ -55,26 +69,138 @@ def get_spotify_recs(journals, gai_client, sp):
                     'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
                 })
                 genre_tracks_collected += 1
-            
+
             artists_seen.add(artist['id'])
 
-    final_tracks = final_tracks[:max_total_tracks] #break down to only the top max total tracks
+        if len(final_tracks) >= max_total_tracks: #enough already, skip the remaining lookups
+            break
+
+    return final_tracks[:max_total_tracks] #break down to only the top max total tracks
+
+
+#artists each genre will most likely need, fetched up front in parallel
+def likely_artists(genres, artists_by_genre, max_total_tracks=20, max_tracks_per_artist=2):
+    per_genre = math.ceil(math.ceil(max_total_tracks / len(genres)) / max_tracks_per_artist)
+    ids = []
+    for artists in artists_by_genre:
+        ids.extend(a['id'] for a in artists[:per_genre] if a['id'] not in ids)
+    return ids
+
+
+def search_genre_artists(sp, genre):
+    return spotify_cache.get(f"search:{genre}",
+                             lambda: sp.search(q=f'genre:"{genre}"', type='artist', limit=10)['artists']['items'],
+                             SPOTIFY_SEARCH_FRESH, SPOTIFY_SEARCH_MAX_AGE)
+
+
+def artist_top_tracks(sp, artist_id):
+    return spotify_cache.get(f"top:{artist_id}",
+                             lambda: sp.artist_top_tracks(artist_id, country='US')['tracks'],
+                             SPOTIFY_TRACKS_FRESH, SPOTIFY_TRACKS_MAX_AGE)
+
+
+@timed("spotify.fetch_tracks")
+def fetch_spotify_tracks(genres, sp, max_total_tracks=20):
+    artists_by_genre = list(spotify_executor.map(lambda genre: search_genre_artists(sp, genre), genres))
+
+    pending = {artist_id: spotify_executor.submit(artist_top_tracks, sp, artist_id)
+               for artist_id in likely_artists(genres, artists_by_genre, max_total_tracks)}
+
+    assembler = assemble_tracks(genres, artists_by_genre, max_total_tracks)
+    try:
+        artist_id = next(assembler)
+        while True:
+            if artist_id not in pending: #an artist was skipped or had few tracks, fetch the next one
+                pending[artist_id] = spotify_executor.submit(artist_top_tracks, sp, artist_id)
+            artist_id = assembler.send(pending[artist_id].result())
+    except StopIteration as done:
+        return done.value
+    finally:
+        for future in pending.values():
+            future.cancel()
 
-    return final_tracks
+
+#bump when a prompt's wording / output format changes so memoized responses are not reused
+GENRE_PROMPT_VERSION = 3
+MENTOR_PROMPT_VERSION = 3
+
+
+#instructions first and the journals (utils/llms/context.py) last, so the start of every prompt of
+#one kind is byte-identical across users and calls and can be served from gemini's prefix cache
+GENRES_INSTRUCTIONS = """You are a music therapist AI. A person writes journals every day, their latest journals are below (oldest first, older ones may be summarized).
+Suggest 3 music genres that could help to improve or maintain their mood and well-being depending on if they are doing not well or well. Your are the judge. Be specific. These genres must be spotify approved genres.
+Reply with a JSON array of the genre names, example: ["genre1", "genre2", "genre3"]. DO NOT INCLUDE ANY OTHER INFORMATION OTHER THAN WHAT IS SHOWN IN THE EXAMPLE.
+
+Journals:
+"""
+
+
+def genres_prompt(journals):
+    return GENRES_INSTRUCTIONS + journals
+
+
+#list of lowercase genre names (utils/llms/structured.py re-asks once if the reply is unusable)
+def choose_genres(journals, gai_client):
+    return generate_structured(genres_prompt(journals), gai_client, GENRES_CONFIG, parse_genres)
+
+
+#genres can be passed in (eg memoized) to skip the llm call
+@timed("spotify.recs")
+def get_spotify_recs(journals, gai_client, sp, genres=None):
+
+    if genres is None:
+        genres = choose_genres(journals, gai_client)
+
+    return fetch_spotify_tracks(genres, sp)
 
 
 #make the prompts + responses for mood mentor
 
-def query_mood_mentor(journals, gai_client):
+MOOD_MENTOR_INSTRUCTIONS = """You are a psychologist's assisstant. You will find credible and factual information backed by verified and trusted sources about mental health.
+Below are a few journals your patient has been writing documenting their day (oldest first, older ones may be summarized). Identify any issues, provide actionable steps and therapies, and include sources for every single thing you say that the patient can visit for more information. Act as if you are providing this information directly to the patient.
+The format MUST BE a JSON array with one object per issue. Example format that you must follow: [{"issue": "Issue 1", "steps": ["step 1", "step 2"], "therapies": ["Therapy 1", "Therapy 2"], "sources": ["Source 1 link", "Source 2 link"]}, {"issue": "Issue 2", "steps": ["step 1", "step 2"], "therapies": ["Therapy 1", "Therapy 2"], "sources": ["Source 1 link", "Source 2 link"]}]. DO NOT INCLUDE ANY INFORMATION OUTSIDE OF THIS FORMAT. Links should be LINKS ONLY
+
+Journals:
+"""
+
 
-    prompt = f"""You are a psychologist's assisstant. You will find credible and factual information backed by verified and trusted sources about mental health.
-                Here are a few journals your patient has been writing documenting their day: {journals}. Identify any issues, provide actionable steps and therapies, and include sources for every single thing you say that the patient can visit for more information. Act as if you are providing this information directly to the patient.
-                The format MUST BE in json format. Example format that you must follow: {"[{'Issue 1': {'Steps':['step 1', 'step 2'], 'Therapies':['Therapy 1', 'Therapy 2'], 'Sources':['Source 1 link', 'Source 2 link']}}, {'Issue 2': {'Steps':['step 1', 'step 2'], 'Therapies':['Therapy 1', 'Therapy 2'], 'Sources':['Source 1 link', 'Source 2 link']}}]"}. DO NOT INCLUDE ANY INFORMATION OUTSIDE OF THIS FORMAT. Links should be LINKS ONLY
-            """
+def mood_mentor_prompt(journals):
+    return MOOD_MENTOR_INSTRUCTIONS + journals
 
-    results = json.loads(make_query(prompt, gai_client).text.replace("json","").strip().replace("```json", "").replace("```", "").strip())
 
-    return results
+#typed MentorIssues come back from the llm, the api keeps the [{'Issue': {'Steps', 'Therapies', 'Sources'}}] shape
+def mentor_json(issues):
+    return [issue.as_json() for issue in issues]
+
+
+def query_mood_mentor(journals, gai_client):
+
+    prompt = mood_mentor_prompt(journals)
+
+    results = generate_structured(prompt, gai_client, MENTOR_CONFIG, parse_mood_mentor)
+
+    return mentor_json(results)
+
+
+#yields each issue object as soon as it has been fully generated, items that don't validate are skipped
+#a reply that isn't a json array at all, or whose array has no usable issue (eg a "[3]" in prose before
+#the answer), falls back to the non-streamed query (with its re-ask) as long as nothing has been sent yet
+def stream_mood_mentor(journals, gai_client):
+    seen = sent = 0
+    try:
+        for item in iter_json_array_items(make_query_stream(mood_mentor_prompt(journals), gai_client, config=MENTOR_CONFIG)):
+            seen += 1
+            issue = parse_mentor_issue(item)
+            if issue is not None:
+                sent += 1
+                yield issue.as_json()
+    except ValueError:
+        if sent:
+            raise StructuredOutputError("mood mentor: stream ended with invalid json")
+        yield from query_mood_mentor(journals, gai_client)
+        return
+    if seen and not sent:
+        yield from query_mood_mentor(journals, gai_client)
 
 
 
@@ -1,8 +1,11 @@
 import os
 from google import genai
 from google.genai import types
+from utils.metrics import span, timed
 
 
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+
 #make the google ai gemini client to be reused elsewhere (for easy use)
 def make_client():
     key = os.environ.get("aistudiokey")
@@ -10,8 +13,25 @@ def make_client():
     return client
 
 #.text for actual response text
-def make_query(querytext, client):
+#config: optional types.GenerateContentConfig (eg a json response schema, utils/llms/structured.py)
+@timed("gemini.generate")
+def make_query(querytext, client, config=None):
     return client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=querytext
-    )
\ No newline at end of file
+        model=GEMINI_MODEL,
+        contents=querytext,
+        config=config
+    )
+
+
+#same query streamed, yields text chunks as gemini generates them
+#the span covers the whole stream, including time the consumer spends between chunks
+def make_query_stream(querytext, client, config=None):
+    with span("gemini.stream"):
+        for chunk in client.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=querytext,
+            config=config
+        ):
+            if chunk.text:
+                yield chunk.text
+
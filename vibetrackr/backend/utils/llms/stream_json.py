@@ -0,0 +1,52 @@
+import json
+
+
+#incremental parser for a streamed top-level json array: yields each element as soon as its
+#closing bracket / comma arrives instead of waiting for the whole response
+#anything before the first "[" (eg a ```json fence) and after the closing "]" is ignored
+#ValueError (like json.loads) if there is no array or the stream ends before it is closed
+def iter_json_array_items(chunks):
+    started = False
+    depth = 0  #nesting inside the current element
+    in_string = False
+    escaped = False
+    item = []
+
+    for chunk in chunks:
+        for ch in chunk:
+            if not started:
+                if ch == "[":
+                    started = True
+                continue
+
+            if in_string:
+                item.append(ch)
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+
+            if depth == 0 and ch in ",]":
+                text = "".join(item).strip()
+                item = []
+                if text:
+                    yield json.loads(text)
+                if ch == "]":
+                    return
+                continue
+
+            item.append(ch)
+            if ch == '"':
+                in_string = True
+            elif ch in "[{":
+                depth += 1
+            elif ch in "]}":
+                depth -= 1
+                if depth == 0:
+                    yield json.loads("".join(item).strip())
+                    item = []
+
+    raise ValueError("json array was cut off" if started else "no json array in the response")
@@ -0,0 +1,174 @@
+import os
+import re
+import ast
+import json
+from typing import List
+from google.genai import types
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator
+from utils.llms.query import make_query
+from utils.metrics import span
+
+
+#typed llm responses: gemini is asked for json matching a response schema (the pydantic models below)
+#and the reply is still parsed tolerantly (code fences, text around the json, single quotes, the
+#older output formats) then validated. a reply that still doesn't validate is re-asked at most
+#LLM_REASKS times before StructuredOutputError is raised (unusable replies show up as llm.parse errors)
+
+LLM_REASKS = int(os.environ.get("LLM_REASKS", 1))
+FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+class StructuredOutputError(ValueError):
+    pass
+
+
+#plain required fields only, constraints / defaults are checked here rather than sent in the schema
+class MentorIssue(BaseModel):
+    issue: str
+    steps: List[str]
+    therapies: List[str]
+    sources: List[str]
+
+    @field_validator("issue")
+    @classmethod
+    def named(cls, value):
+        if not value.strip():
+            raise ValueError("issue needs a name")
+        return value.strip()
+
+    #frontend shape: {'Issue': {'Steps': [...], 'Therapies': [...], 'Sources': [...]}}
+    def as_json(self):
+        return {self.issue: {'Steps': self.steps, 'Therapies': self.therapies, 'Sources': self.sources}}
+
+
+GENRES_SCHEMA = TypeAdapter(List[str])
+MENTOR_SCHEMA = TypeAdapter(List[MentorIssue])
+
+
+def json_config(schema):
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
+
+GENRES_CONFIG = json_config(List[str])
+MENTOR_CONFIG = json_config(List[MentorIssue])
+
+
+def _next_start(text, i):
+    starts = [j for j in (text.find("[", i), text.find("{", i)) if j >= 0]
+    return min(starts) if starts else -1
+
+
+#python literal (single quotes etc) from start to the last matching closing bracket, (None, -1) if not one
+def _literal(text, start):
+    end = text.rfind("]" if text[start] == "[" else "}")
+    try:
+        return ast.literal_eval(text[start:end + 1]), end + 1
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None, -1
+
+
+#every json value in the text in order, ignoring fences / prose around them (python literals as a last
+#resort). a value that parses isn't searched for nested ones, the next candidate starts after it
+def json_values(text):
+    text = FENCE_RE.sub("", text or "").strip()
+    decoder = json.JSONDecoder()
+    start = _next_start(text, 0)
+    while start >= 0:
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            value, end = _literal(text, start)
+        if end < 0:
+            start = _next_start(text, start + 1)
+        else:
+            yield value
+            start = _next_start(text, end)
+
+
+#first json value in the text that parse_value accepts, so brackets in prose around the answer
+#("here are [3] picks: [...]") don't cost a re-ask
+def parse_first(text, parse_value):
+    error = StructuredOutputError("no json in the response")
+    for value in json_values(text):
+        try:
+            return parse_value(value)
+        except StructuredOutputError as e:
+            error = e
+    raise error
+
+
+#["a", "b"], ["a, b, c"] (the old prompt format) or {"genres": [...]}
+def parse_genres(text):
+    return parse_first(text, genres_value)
+
+
+def genres_value(value):
+    if isinstance(value, dict):
+        value = value.get("genres", value.get("Genres"))
+    try:
+        genres = GENRES_SCHEMA.validate_python(value)
+    except ValidationError:
+        raise StructuredOutputError("genres: expected a list of genre names")
+
+    seen = []
+    for genre in genres:
+        for name in genre.split(","):
+            name = name.strip().strip("'\"").lower()
+            if name and name not in seen:
+                seen.append(name)
+    if not seen:
+        raise StructuredOutputError("genres: empty list")
+    return seen
+
+
+#one issue in the schema shape or the old {'Issue': {'Steps': ..., ...}} shape, None if unusable
+def parse_mentor_issue(value):
+    if isinstance(value, dict) and "issue" not in value and len(value) == 1:
+        name, details = next(iter(value.items()))
+        if isinstance(details, dict):
+            value = {"issue": name, **{k.lower(): v for k, v in details.items()}}
+    if isinstance(value, dict):
+        value = {"steps": [], "therapies": [], "sources": [], **value}
+    try:
+        return MentorIssue.model_validate(value)
+    except ValidationError:
+        return None
+
+
+def parse_mood_mentor(text):
+    return parse_first(text, mood_mentor_value)
+
+
+def mood_mentor_value(value):
+    if isinstance(value, dict):
+        value = value.get("issues", [value])
+    if not isinstance(value, list):
+        raise StructuredOutputError("mood mentor: expected a list of issues")
+
+    issues = [parse_mentor_issue(item) for item in value]
+    if value and not any(issues):
+        raise StructuredOutputError("mood mentor: no valid issues")
+    return [issue for issue in issues if issue is not None]
+
+
+#appended (not prepended) so the re-ask keeps the prompt's cached prefix
+def reask_prompt(prompt, error):
+    return (f"{prompt}\n\nYour previous reply could not be used ({error}). "
+            "Reply again with only the JSON in the requested format.")
+
+
+def parse_reply(parse, text):
+    with span("llm.parse"):
+        return parse(text)
+
+
+def generate_structured(prompt, client, config, parse, reasks=LLM_REASKS):
+    query = prompt
+    for attempt in range(reasks + 1):
+        try:
+            return parse_reply(parse, make_query(query, client, config=config).text)
+        except StructuredOutputError as e:
+            if attempt == reasks:
+                raise
+            query = reask_prompt(prompt, e)
+
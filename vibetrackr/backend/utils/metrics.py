@@ -0,0 +1,196 @@
+import os
+import hmac
+import json
+import time
+import bisect
+import random
+import logging
+import threading
+import functools
+import contextvars
+from collections import deque
+
+
+#per-route + per-stage latency histograms (prometheus text format at /metrics) and sampled traces
+#of slow requests. a span costs two perf_counter calls, a bisect and a short lock, so it stays on in
+#production. numbers are per process (each gunicorn worker serves its own /metrics)
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+#requests slower than this are candidates for a logged trace (0 = no traces)
+SLOW_REQUEST_MS = float(os.environ.get("METRICS_SLOW_MS", 2000))
+#fraction of slow requests whose trace is kept + logged
+TRACE_SAMPLE_RATE = float(os.environ.get("METRICS_TRACE_SAMPLE", 0.1))
+#shared secret the scraper sends as "Authorization: Bearer <token>", /metrics is off while unset
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+slow_traces = deque(maxlen=int(os.environ.get("METRICS_TRACE_SIZE", 100)))
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) #last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+#metric name -> {label tuple: Histogram}
+_histograms = {
+    "vibetrackr_request_duration_seconds": {},
+    "vibetrackr_stage_duration_seconds": {},
+}
+_errors = {}
+_lock = threading.Lock()
+
+_HELP = {
+    "vibetrackr_request_duration_seconds": "Request latency by route, method and status",
+    "vibetrackr_stage_duration_seconds": "Latency of each stage (auth, firestore, vad, gemini, spotify) inside requests and jobs",
+}
+_LABELS = {
+    "vibetrackr_request_duration_seconds": ("route", "method", "status"),
+    "vibetrackr_stage_duration_seconds": ("stage",),
+}
+
+
+def _histogram(metric, labels):
+    histogram = _histograms[metric].get(labels)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms[metric].setdefault(labels, Histogram())
+    return histogram
+
+
+#constant time compare so the token can't be guessed byte by byte from response times
+def scrape_authorized(auth_header):
+    if not METRICS_TOKEN or not (auth_header or "").startswith("Bearer "):
+        return False
+    return hmac.compare_digest(auth_header[len("Bearer "):].encode("utf-8"), METRICS_TOKEN.encode("utf-8"))
+
+
+# === Spans ===
+#(trace start, [(stage, offset, seconds)]) for the request running in this context
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def observe_stage(stage, seconds, failed=False):
+    _histogram("vibetrackr_stage_duration_seconds", (stage,)).observe(seconds)
+    if failed:
+        with _lock:
+            _errors[stage] = _errors.get(stage, 0) + 1
+
+
+class span:
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not METRICS_ENABLED:
+            return False
+        elapsed = time.perf_counter() - self.start
+        observe_stage(self.stage, elapsed, failed=exc_type is not None)
+
+        trace = _trace.get()
+        if trace is not None:
+            trace[1].append((self.stage, self.start - trace[0], elapsed))
+        return False
+
+
+#decorator version of span
+def timed(stage):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# === Requests ===
+def start_request():
+    if METRICS_ENABLED:
+        _trace.set((time.perf_counter(), []))
+
+
+#record the route histogram, and keep / log the trace if the request was slow and sampled
+def finish_request(route, method, status, seconds):
+    trace = _trace.get()
+    _trace.set(None)
+    if not METRICS_ENABLED:
+        return
+
+    _histogram("vibetrackr_request_duration_seconds", (route, method, str(status))).observe(seconds)
+
+    if trace is not None and SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS and random.random() < TRACE_SAMPLE_RATE:
+        record = {
+            "route": route,
+            "method": method,
+            "status": status,
+            "ms": round(seconds * 1000, 1),
+            "at": time.time(),
+            "spans": [{"stage": stage, "offset_ms": round(offset * 1000, 1), "ms": round(elapsed * 1000, 1)}
+                      for stage, offset, elapsed in sorted(trace[1], key=lambda s: s[1])],
+        }
+        slow_traces.append(record)
+        logger.warning("slow request %s", json.dumps(record))
+
+
+# === Exposition ===
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+#prometheus text exposition format (version 0.0.4)
+def render():
+    lines = []
+    for metric, series in _histograms.items():
+        lines.append(f"# HELP {metric} {_HELP[metric]}")
+        lines.append(f"# TYPE {metric} histogram")
+        names = _LABELS[metric]
+
+        for labels, histogram in sorted(series.items()):
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(names + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(names, labels)} {total}")
+            lines.append(f"{metric}_count{_labels(names, labels)} {count}")
+
+    lines.append("# HELP vibetrackr_stage_errors_total Stages that raised")
+    lines.append("# TYPE vibetrackr_stage_errors_total counter")
+    with _lock:
+        errors = sorted(_errors.items())
+    for stage, count in errors:
+        lines.append(f"vibetrackr_stage_errors_total{_labels(('stage',), (stage,))} {count}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utils.ml.client_pool import ClientPool
+
+
+#every backend returns raw model VAD scores (EmoBank 1-5 scale) as (valence, arousal, dominance) tuples
+#name goes into the vad cache key so scores from different backends never mix
+
+#hosted hugging face space through the gradio client pool
+class GradioBackend:
+
+    def __init__(self, src="RobroKools/vad-emotion", pool_size=4, timeout=30.0, health_interval=300.0):
+        self.name = src
+        self.pool = ClientPool(src, size=pool_size, timeout=timeout, health_interval=health_interval)
+        #the space only scores one text per call, so a batch fans out across the client pool
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="vad")
+
+    def predict(self, text):
+        valence, arousal, dominance = self.pool.predict(text, api_name="/predict")
+        return (valence, arousal, dominance)
+
+    def predict_batch(self, texts):
+        return list(self._executor.map(self.predict, texts))
+
+    def warmup(self):
+        pass
+
+
+#same fine-tuned bert regressor run in-process on cpu (quantized torch or onnx runtime)
+class LocalBackend:
+
+    def __init__(self, model="RobroKools/vad-bert", runtime="torch", threads=None, quantize=True,
+                 onnx_path=None, max_length=128):
+        self.model_name = model
+        self.runtime = runtime
+        self.threads = threads
+        self.quantize = quantize and runtime == "torch"
+        self.onnx_path = onnx_path
+        self.max_length = max_length
+        self.name = f"{model}:{runtime}{':int8' if self.quantize else ''}"
+
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+        self._session = None
+
+    def _load(self):
+        with self._lock:
+            if self._tokenizer is not None:
+                return
+
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+
+            if self.runtime == "onnx":
+                import onnxruntime as ort
+                if not self.onnx_path or not os.path.exists(self.onnx_path):
+                    raise FileNotFoundError(f"ONNX model not found at {self.onnx_path!r}, run export_onnx first")
+                options = ort.SessionOptions()
+                if self.threads:
+                    options.intra_op_num_threads = self.threads
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                self._session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+            else:
+                import torch
+                from transformers import AutoModelForSequenceClassification
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                model = AutoModelForSequenceClassification.from_pretrained(self.model_name).eval()
+                if self.quantize:
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._model = model
+
+            self._tokenizer = tokenizer
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts):
+        self._load()
+        encoded = self._tokenizer(list(texts), truncation=True, padding=True, max_length=self.max_length,
+                                  return_tensors="np" if self.runtime == "onnx" else "pt")
+
+        if self.runtime == "onnx":
+            inputs = {i.name: encoded[i.name].astype(np.int64) for i in self._session.get_inputs()}
+            logits = self._session.run(None, inputs)[0]
+        else:
+            import torch
+            with torch.inference_mode():
+                logits = self._model(**encoded).logits.numpy()
+
+        return [tuple(row.tolist()) for row in logits]
+
+    #load weights and run one pass so the first journal does not pay for it
+    def warmup(self):
+        self.predict_batch(["warming up the vad model"])
+
+
+#export the hugging face model to onnx for the onnx runtime backend
+def export_onnx(path, model="RobroKools/vad-bert", max_length=128):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    net = AutoModelForSequenceClassification.from_pretrained(model).eval()
+    sample = tokenizer(["sample journal text"], truncation=True, padding="max_length", max_length=max_length, return_tensors="pt")
+    names = list(sample.keys())
+
+    torch.onnx.export(net, tuple(sample[n] for n in names), path,
+                      input_names=names,
+                      output_names=["logits"],
+                      dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in names}, "logits": {0: "batch"}},
+                      opset_version=14)
+
+
+#pick the backend from env: VAD_BACKEND=gradio (default) or local
+def make_backend():
+    kind = os.environ.get("VAD_BACKEND", "gradio")
+    if kind == "local":
+        threads = os.environ.get("VAD_THREADS")
+        return LocalBackend(model=os.environ.get("VAD_LOCAL_MODEL", "RobroKools/vad-bert"),
+                            runtime=os.environ.get("VAD_RUNTIME", "torch"),
+                            threads=int(threads) if threads else None,
+                            quantize=os.environ.get("VAD_QUANTIZE", "1") == "1",
+                            onnx_path=os.environ.get("VAD_ONNX_PATH"))
+    if kind == "gradio":
+        return GradioBackend(src=os.environ.get("VAD_SPACE", "RobroKools/vad-emotion"),
+                             pool_size=int(os.environ.get("VAD_POOL_SIZE", 4)),
+                             timeout=float(os.environ.get("VAD_TIMEOUT", 30)),
+                             health_interval=float(os.environ.get("VAD_HEALTH_INTERVAL", 300)))
+    raise ValueError(f"Unknown VAD_BACKEND {kind!r}")
@@ -0,0 +1,70 @@
+import threading
+import time
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+#collects concurrent single-text requests for a short window and runs them as one batch
+class MicroBatcher:
+
+    def __init__(self, predict_batch, window=0.01, max_batch=16, max_inflight=4, name="batcher"):
+        self.predict_batch = predict_batch #list of texts -> list of results (same order)
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._dispatch = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix=name)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, text):
+        self._start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def predict(self, text, timeout=None):
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()] #block until there is something to do
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            #keep collecting the next batch while this one is in flight
+            self._dispatch.submit(self._run, batch)
+
+    def _run(self, batch):
+        #identical texts in one window share a single slot in the batch
+        waiting = {}
+        for text, future in batch:
+            waiting.setdefault(text, []).append(future)
+        texts = list(waiting)
+
+        try:
+            results = self.predict_batch(texts)
+        except Exception as e:
+            for futures in waiting.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        for text, result in zip(texts, results):
+            for future in waiting[text]:
+                future.set_result(result)
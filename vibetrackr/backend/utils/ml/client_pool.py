@@ -0,0 +1,73 @@
+import threading
+import time
+import queue
+import httpx
+from gradio_client import Client
+
+
+#lazily connected pool of gradio clients (nothing touches the network until the first predict)
+class ClientPool:
+
+    def __init__(self, src, size=4, timeout=30.0, health_interval=300.0, retries=1, factory=Client):
+        self.src = src
+        self.size = size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.retries = retries
+        self.factory = factory
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue() #(client, last time it was known good)
+
+    def _connect(self):
+        return self.factory(self.src)
+
+    #ping the space if the client has been idle long enough that the connection may have gone stale
+    def _healthy(self, client, last_ok):
+        if time.monotonic() - last_ok < self.health_interval:
+            return True
+        try:
+            return httpx.get(f"{client.src.rstrip('/')}/config", timeout=self.timeout).status_code == 200
+        except Exception:
+            return False
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No {self.src} client free after {self.timeout}s")
+
+        try:
+            while True:
+                try:
+                    client, last_ok = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(client, last_ok):
+                    return client
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, client):
+        self._idle.put((client, time.monotonic()))
+        self._slots.release()
+
+    #drop a broken client, the next acquire reconnects
+    def _discard(self, client):
+        self._slots.release()
+
+    def predict(self, *args, api_name="/predict"):
+        for attempt in range(self.retries + 1):
+            client = self._acquire()
+            job = None
+            try:
+                job = client.submit(*args, api_name=api_name)
+                result = job.result(timeout=self.timeout)
+            except Exception:
+                if job is not None:
+                    job.cancel()
+                self._discard(client)
+                if attempt == self.retries:
+                    raise
+            else:
+                self._release(client)
+                return result
@@ -0,0 +1,76 @@
+import os
+import re
+import math
+import hashlib
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+
+
+#journal text -> unit vectors for the local search index (utils/ml/journal_index.py)
+#default is a signed feature-hashing embedder (words + word pairs, no model, ~1ms per journal on cpu)
+#EMBED_BACKEND=transformer uses a sentence-transformers model instead (better recall, needs torch)
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("""a an and are as at be been but by for from had has have he her his i i'm im in is it it's its
+me my of on or our she so that the their them then there they this to too up was we were what when which who will
+with you your just very really""".split())
+
+
+@lru_cache(maxsize=200000)
+def _bucket(feature, dim):
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, (1.0 if h >> 63 else -1.0)
+
+
+class HashingEmbedder:
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        words = [w for w in TOKEN_RE.findall((text or "").lower()) if w not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in Counter(self._features(text)).items():
+                col, sign = _bucket(feature, self.dim)
+                vectors[row, col] += sign * (1 + math.log(count)) #sublinear tf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class TransformerEmbedder:
+
+    def __init__(self, model_name, threads=None):
+        self.model_name = model_name
+        self.threads = threads
+        self.name = f"st-{model_name}"
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    @property
+    def dim(self):
+        return self._load().get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        vectors = self._load().encode(list(texts), batch_size=32, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32)
+
+
+def make_embedder():
+    if os.environ.get("EMBED_BACKEND", "hashing") == "transformer":
+        return TransformerEmbedder(os.environ.get("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+                                   threads=int(os.environ.get("EMBED_THREADS", 0)) or None)
+    return HashingEmbedder(dim=int(os.environ.get("EMBED_DIM", 512)))
@@ -16,6 +16,11 @@ EMOTION_VAD = {
     "Neutral":     np.array([0.0, 0.0, 0.0]),
 }
 
+#prototypes + their norms stacked once so batches score with a single matmul
+EMOTION_NAMES = np.array(list(EMOTION_VAD.keys()))
+EMOTION_MATRIX = np.stack(list(EMOTION_VAD.values()))
+EMOTION_NORMS = np.linalg.norm(EMOTION_MATRIX, axis=1)
+
 #define some basic functions
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-8)
@@ -35,6 +40,22 @@ def classify_emotion(vad):
 
     return best_emotion, (np.arccos(best_score) * np.pi) / 180
 
+#classify a whole (N, 3) array of vad rows at once -> (emotions, angular distances)
+def classify_emotions(vads):
+    vads = np.asarray(vads, dtype=np.float64).reshape(-1, 3)
+
+    #same formula (and eps placement) as cosine_similarity, so near ties round the same way as the loop
+    sims = (vads @ EMOTION_MATRIX.T) / (np.linalg.norm(vads, axis=1, keepdims=True) * EMOTION_NORMS + 1e-8)
+    best = np.argmax(sims, axis=1) #first max wins, same tie-break as the loop above
+    best_scores = np.clip(sims[np.arange(len(vads)), best], -1.0, 1.0)
+
+    return EMOTION_NAMES[best], (np.arccos(best_scores) * np.pi) / 180
+
 #magnitude scaled by valence
 def vibescore(v, a, d):
     return v * np.linalg.norm(np.array([v,a,d]))
+
+#vibescore for every row of an (N, 3) array
+def vibescores(vads):
+    vads = np.asarray(vads, dtype=np.float64).reshape(-1, 3)
+    return vads[:, 0] * np.linalg.norm(vads, axis=1)
@@ -0,0 +1,296 @@
+import os
+import json
+import fcntl
+import hashlib
+import tempfile
+import numpy as np
+from utils.cache import LRUCache
+from utils.ml.embeddings import make_embedder
+
+
+#per-user journal vector index on local disk, one shard directory per user:
+#   vectors.npy  (capacity, dim) int8 (+ per-row scales.npy) or float16, memory-mapped
+#   meta.json    embedder, dtype and the journal id / timestamp / date of each row
+#rows are updated in place on add/update and swap-removed on delete, search is one matvec + argpartition
+#the index is derived data: a missing or stale shard (new host, embedder change) is rebuilt from firestore
+#shards are shared by every worker on the host (writes take a file lock, readers reload on meta change)
+#each shard is stamped with the summary's text_version it reflects. a write handled here advances the
+#stamp only if the shard was at the version just before it; anything else (a write handled by another
+#instance, out of order writes) leaves a mismatch and ensure() rebuilds the shard on next use
+
+INIT_JOURNAL = "init_journal"
+
+
+def quantize(vectors, dtype):
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    safe = np.where(scales > 0, scales, 1)
+    return np.round(vectors / safe[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def journal_text(journal):
+    return f"{journal.get('title') or ''}\n{journal.get('content') or ''}"
+
+
+class _Shard:
+
+    def __init__(self, meta, vectors, scales, mtime):
+        self.meta = meta
+        self.vectors = vectors
+        self.scales = scales
+        self.mtime = mtime
+        self.rows = {journal_id: row for row, journal_id in enumerate(meta["ids"])}
+
+    @property
+    def count(self):
+        return len(self.meta["ids"])
+
+
+class JournalIndex:
+
+    def __init__(self, root, embedder, dtype="int8", open_shards=256):
+        self.root = root
+        self.embedder = embedder
+        self.dtype = dtype
+        self._open = LRUCache(maxsize=open_shards) #uid -> readonly mmapped _Shard
+
+    def _dir(self, uid):
+        digest = hashlib.sha256(uid.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _path(self, uid, name):
+        return os.path.join(self._dir(uid), name)
+
+    def _lock(self, uid):
+        os.makedirs(self._dir(uid), exist_ok=True)
+        return _FileLock(self._path(uid, ".lock"))
+
+    def _compatible(self, meta):
+        return meta.get("embedder") == self.embedder.name and meta.get("dtype") == self.dtype
+
+    def _load(self, uid, mode="r"):
+        try:
+            mtime = os.stat(self._path(uid, "meta.json")).st_mtime_ns
+            with open(self._path(uid, "meta.json")) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not self._compatible(meta):
+            return None
+
+        vectors = np.load(self._path(uid, "vectors.npy"), mmap_mode=mode)
+        scales = np.load(self._path(uid, "scales.npy"), mmap_mode=mode) if self.dtype == "int8" else None
+        return _Shard(meta, vectors, scales, mtime)
+
+    #cached readonly view, reloaded when another worker has rewritten the meta file
+    def _shard(self, uid):
+        shard = self._open.get(uid)
+        try:
+            mtime = os.stat(self._path(uid, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            self._open.delete(uid)
+            return None
+        if shard is None or shard.mtime != mtime:
+            shard = self._load(uid)
+            if shard is None:
+                return None
+            self._open.set(uid, shard)
+        return shard
+
+    def _save_arrays(self, uid, vectors, scales):
+        self._replace(uid, "vectors.npy", lambda f: np.save(f, vectors))
+        if scales is not None:
+            self._replace(uid, "scales.npy", lambda f: np.save(f, scales))
+
+    def _save_meta(self, uid, meta):
+        self._replace(uid, "meta.json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    def _replace(self, uid, name, write):
+        fd, tmp = tempfile.mkstemp(dir=self._dir(uid), prefix=f".{name}.")
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, self._path(uid, name))
+
+    def exists(self, uid):
+        return self._shard(uid) is not None
+
+    #(re)build a user's shard from all of their journals (dicts with id, title, content, timestamp, date)
+    #version: the text_version read before the journals were loaded
+    def rebuild(self, uid, journals, version=None):
+        journals = [j for j in journals if j.get("id") != INIT_JOURNAL]
+        if journals:
+            embedded = self.embedder.embed([journal_text(j) for j in journals])
+        else:
+            embedded = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        vectors, scales = quantize(embedded, self.dtype)
+
+        capacity = max(16, len(journals))
+        dim = vectors.shape[1]
+        padded = np.zeros((capacity, dim), dtype=vectors.dtype)
+        padded[:len(journals)] = vectors
+        padded_scales = None
+        if scales is not None:
+            padded_scales = np.zeros(capacity, dtype=np.float32)
+            padded_scales[:len(journals)] = scales
+
+        meta = {"embedder": self.embedder.name, "dtype": self.dtype, "dim": dim, "version": version,
+                "ids": [j["id"] for j in journals],
+                "timestamps": [j.get("timestamp") for j in journals],
+                "dates": [j.get("date") for j in journals]}
+        with self._lock(uid):
+            self._save_arrays(uid, padded, padded_scales)
+            self._save_meta(uid, meta)
+
+    #build from load_journals() if this host has no usable shard yet or it is behind version
+    def ensure(self, uid, load_journals, version=None):
+        shard = self._shard(uid)
+        if shard is None or (version is not None and shard.meta.get("version") != version):
+            self.rebuild(uid, load_journals(), version)
+
+    def _stamp(self, meta, version):
+        in_step = version is not None and meta.get("version") == version - 1
+        meta["version"] = version if in_step else None
+
+    def drop(self, uid):
+        with self._lock(uid):
+            try:
+                os.remove(self._path(uid, "meta.json"))
+            except FileNotFoundError:
+                pass
+        self._open.delete(uid)
+
+    #add or replace one journal's row; shards that were never built are left for ensure()
+    #version: the text_version this write produced
+    def upsert(self, uid, journal_id, journal, version=None):
+        if journal_id == INIT_JOURNAL or not os.path.exists(self._path(uid, "meta.json")):
+            return False
+        vector, scale = quantize(self.embedder.embed([journal_text(journal)]), self.dtype)
+
+        with self._lock(uid):
+            shard = self._load(uid, mode="r+")
+            if shard is None:
+                return False
+            meta = shard.meta
+            row = shard.rows.get(journal_id)
+
+            if row is None:
+                row = shard.count
+                if row >= len(shard.vectors): #full, double the capacity
+                    vectors = np.zeros((2 * len(shard.vectors), shard.vectors.shape[1]), dtype=shard.vectors.dtype)
+                    vectors[:row] = shard.vectors[:row]
+                    scales = None
+                    if shard.scales is not None:
+                        scales = np.zeros(len(vectors), dtype=np.float32)
+                        scales[:row] = shard.scales[:row]
+                    self._save_arrays(uid, vectors, scales)
+                    shard = self._load(uid, mode="r+")
+                meta["ids"].append(journal_id)
+                meta["timestamps"].append(journal.get("timestamp"))
+                meta["dates"].append(journal.get("date"))
+            else:
+                meta["timestamps"][row] = journal.get("timestamp")
+                meta["dates"][row] = journal.get("date")
+            self._stamp(meta, version)
+
+            shard.vectors[row] = vector[0]
+            shard.vectors.flush()
+            if shard.scales is not None:
+                shard.scales[row] = scale[0]
+                shard.scales.flush()
+            self._save_meta(uid, meta)
+        return True
+
+    def delete(self, uid, journal_id, version=None):
+        if not os.path.exists(self._path(uid, "meta.json")):
+            return False
+
+        with self._lock(uid):
+            shard = self._load(uid, mode="r+")
+            if shard is None or journal_id not in shard.rows:
+                if shard is not None: #nothing to remove here, but the write still happened
+                    self._stamp(shard.meta, version)
+                    self._save_meta(uid, shard.meta)
+                return False
+            meta = shard.meta
+            row, last = shard.rows[journal_id], shard.count - 1
+
+            #move the last row into the hole so rows stay dense
+            shard.vectors[row] = shard.vectors[last]
+            shard.vectors.flush()
+            if shard.scales is not None:
+                shard.scales[row] = shard.scales[last]
+                shard.scales.flush()
+            for field in ("ids", "timestamps", "dates"):
+                meta[field][row] = meta[field][last]
+                meta[field].pop()
+            self._stamp(meta, version)
+            self._save_meta(uid, meta)
+        return True
+
+    def _scores(self, shard, query):
+        n = shard.count
+        scores = np.asarray(shard.vectors[:n], dtype=np.float32) @ query
+        if shard.scales is not None:
+            scores *= shard.scales[:n]
+        return scores
+
+    def _top_k(self, shard, scores, k, exclude=(), start_date=None, end_date=None):
+        mask = np.ones(len(scores), dtype=bool)
+        for journal_id in exclude:
+            row = shard.rows.get(journal_id)
+            if row is not None:
+                mask[row] = False
+        if start_date or end_date:
+            dates = shard.meta["dates"]
+            mask &= np.array([(not start_date or (d or "") >= start_date) and (not end_date or (d or "") <= end_date)
+                              for d in dates], dtype=bool)
+
+        candidates = np.flatnonzero(mask)
+        if not len(candidates) or k <= 0:
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(shard.meta["ids"][row], float(scores[row])) for row in top]
+
+    #[(journal_id, cosine score)] best first
+    def search(self, uid, text, k=10, exclude=(), start_date=None, end_date=None):
+        shard = self._shard(uid)
+        if shard is None or not shard.count:
+            return []
+        query = self.embedder.embed([text])[0]
+        return self._top_k(shard, self._scores(shard, query), k, exclude, start_date, end_date)
+
+    #journals most like an already indexed one (itself excluded)
+    def similar(self, uid, journal_id, k=5):
+        shard = self._shard(uid)
+        if shard is None or journal_id not in shard.rows:
+            return []
+        row = shard.rows[journal_id]
+        query = np.asarray(shard.vectors[row], dtype=np.float32)
+        if shard.scales is not None:
+            query = query * shard.scales[row]
+        return self._top_k(shard, self._scores(shard, query), k, exclude=(journal_id,))
+
+
+class _FileLock:
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._f = open(self.path, "a")
+        fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+JOURNAL_INDEX_ENABLED = os.environ.get("JOURNAL_INDEX", "1") == "1"
+journal_index = JournalIndex(os.environ.get("JOURNAL_INDEX_PATH", os.path.join(tempfile.gettempdir(), "vibetrackr-journal-index")),
+                             make_embedder(),
+                             dtype=os.environ.get("JOURNAL_INDEX_DTYPE", "int8"),
+                             open_shards=int(os.environ.get("JOURNAL_INDEX_OPEN_SHARDS", 256)))
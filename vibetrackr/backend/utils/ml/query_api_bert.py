@@ -1,36 +1,135 @@
+import os
+import hashlib
 import numpy as np
-from gradio_client import Client
 import time
-from utils.ml.emotions import classify_emotion, vibescore
+from utils.cache import make_cache
+from utils.ml.backends import make_backend
+from utils.ml.batching import MicroBatcher
+from utils.ml.emotions import classify_emotion, classify_emotions, vibescore, vibescores
+from utils.metrics import span, timed
+
+
+#bump when the model is redeployed with new weights so old cached scores are not reused
+VAD_MODEL_VERSION = os.environ.get("VAD_MODEL_VERSION", "1")
+
+#raw model output cache keyed by content hash (title-only edits + repeated text skip the remote call)
+vad_cache = make_cache(maxsize=int(os.environ.get("VAD_CACHE_SIZE", 4096)),
+                       ttl=float(os.environ.get("VAD_CACHE_TTL", 7 * 24 * 3600)),
+                       path=os.environ.get("VAD_CACHE_PATH"),
+                       table="vad_cache")
+
+#gradio space or local cpu model, chosen by VAD_BACKEND (clients/weights load on first use)
+vad_backend = make_backend()
+if os.environ.get("VAD_WARMUP", "0") == "1":
+    vad_backend.warmup()
+
+
+#whitespace-insensitive hash of the text for the given backend + model version
+def vad_cache_key(text, model_version=VAD_MODEL_VERSION):
+    normalized = " ".join((text or "").split())
+    return hashlib.sha256(f"{vad_backend.name}:{model_version}:{normalized}".encode("utf-8")).hexdigest()
 
 
 #calculate the VAD scores
-def calc_vad(text, client=Client("RobroKools/vad-emotion")):
+@timed("vad.predict")
+def calc_vad(text, client=None):
 
-    valence, arousal, dominance = client.predict(text, api_name="/predict")
+    if client is None:
+        valence, arousal, dominance = vad_backend.predict(text)
+    else:
+        valence, arousal, dominance = client.predict(text, api_name="/predict")
     return (valence, arousal, dominance)
 
 
+@timed("vad.predict_batch")
+def calc_vad_batch(texts):
+    return vad_backend.predict_batch(texts)
+
+
+#concurrent requests within VAD_BATCH_WINDOW_MS are grouped into one calc_vad_batch call (0 = off)
+VAD_BATCH_WINDOW_MS = float(os.environ.get("VAD_BATCH_WINDOW_MS", 0))
+vad_batcher = MicroBatcher(calc_vad_batch,
+                           window=VAD_BATCH_WINDOW_MS / 1000,
+                           max_batch=int(os.environ.get("VAD_BATCH_SIZE", 16)),
+                           name="vad-batcher")
+
+
+#calc_vad with the content-hash cache in front of it
+def cached_vad(text):
+    key = vad_cache_key(text)
+    vad = vad_cache.get(key)
+    if vad is None:
+        vad = vad_batcher.predict(text) if VAD_BATCH_WINDOW_MS > 0 else calc_vad(text)
+        vad_cache.set(key, list(vad))
+    return tuple(vad)
+
+
+#cached_vad for many texts, misses go out as one batch
+def cached_vad_batch(texts):
+    keys = [vad_cache_key(text) for text in texts]
+    vads = [vad_cache.get(key) for key in keys]
+
+    misses = [i for i, vad in enumerate(vads) if vad is None]
+    if misses:
+        for i, vad in zip(misses, calc_vad_batch([texts[i] for i in misses])):
+            vads[i] = list(vad)
+            vad_cache.set(keys[i], vads[i])
+    return [tuple(vad) for vad in vads]
+
+
+@timed("analysis.analyze_journal")
 def analyze_journal(text):
-    
-    valence, arousal, dominance = calc_vad(text)
+
+    valence, arousal, dominance = cached_vad(text)
     vad_mean = [valence, arousal, dominance]
 
     vad_mean[0] = (2 * vad_mean[0] / 5) - 1
     vad_mean[1] = (2 * vad_mean[1] / 5) - 1
     vad_mean[2] = (2 * vad_mean[2] / 5) - 1
 
-    emotion, dist = classify_emotion(vad_mean)
+    with span("analysis.classify"):
+        emotion, dist = classify_emotion(vad_mean)
 
-    vs = vibescore(vad_mean[0], vad_mean[1],vad_mean[2])
+        vs = vibescore(vad_mean[0], vad_mean[1],vad_mean[2])
 
-    return {"V": vad_mean[0], 
-            "A": vad_mean[1], 
-            "D": vad_mean[2], 
+    return {"V": vad_mean[0],
+            "A": vad_mean[1],
+            "D": vad_mean[2],
             "Emotion":emotion,
-            "Valence_Scaled_By_Mag":vs.item(), 
-            "Emotive_Angular_Distance":dist.item()}
+            "Valence_Scaled_By_Mag":vs.item(),
+            "Emotive_Angular_Distance":dist.item(),
+            "Raw_VAD": [float(valence), float(arousal), float(dominance)]} #model output, lets reanalysis skip the model
+
+
+#map raw 1-5 model scores onto [-1, 1] (same scaling as analyze_journal), rows of an (N, 3) array
+def scale_vads(raw_vads):
+    return (2 * np.asarray(raw_vads, dtype=np.float64).reshape(-1, 3) / 5) - 1
+
+
+#analysis dicts for many raw vad triples, classified in one vectorized pass
+@timed("analysis.classify_batch")
+def analyze_vads(raw_vads):
+    raw_vads = np.asarray(raw_vads, dtype=np.float64).reshape(-1, 3)
+    vads = scale_vads(raw_vads)
+    emotions, dists = classify_emotions(vads)
+    vs = vibescores(vads)
+
+    return [{"V": vad[0].item(),
+             "A": vad[1].item(),
+             "D": vad[2].item(),
+             "Emotion": emotion.item(),
+             "Valence_Scaled_By_Mag": score.item(),
+             "Emotive_Angular_Distance": dist.item(),
+             "Raw_VAD": raw.tolist()}
+            for raw, vad, emotion, score, dist in zip(raw_vads, vads, emotions, vs, dists)]
+
+
+#batch version of analyze_journal (imports, backfills)
+def analyze_journals(texts):
+    if not texts:
+        return []
+    return analyze_vads(cached_vad_batch(texts))
 
 
 if __name__ == "__main__":
-    print(analyze_journal("I felt terrible, gross, fucking hurting all day long."))
\ No newline at end of file
+    print(analyze_journal("I felt terrible, gross, fucking hurting all day long."))
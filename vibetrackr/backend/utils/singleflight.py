@@ -0,0 +1,33 @@
+import threading
+from concurrent.futures import Future
+
+
+#concurrent calls with the same key share one in-flight computation: the first caller runs fn,
+#everyone arriving before it finishes waits for and gets the same result (or exception)
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
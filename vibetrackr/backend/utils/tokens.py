@@ -0,0 +1,45 @@
+import os
+import time
+import hashlib
+from firebase_admin import auth
+from utils.cache import LRUCache
+
+
+#decoded claims per token hash, each entry lives until the token's own exp
+token_cache = LRUCache(maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 10000)))
+#seconds between revocation checks for a cached token (0 = never check, like before)
+REVOCATION_CHECK_INTERVAL = float(os.environ.get("TOKEN_REVOCATION_CHECK", 0))
+
+
+def token_key(id_token):
+    return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+
+def _remember(key, claims, checked_at):
+    ttl = claims["exp"] - time.time()
+    if ttl > 0:
+        token_cache.set(key, (claims, checked_at), ttl=ttl)
+
+
+#auth.verify_id_token with the signature check done once per token instead of once per request
+#(google's signing certs are fetched and http-cached by the admin sdk itself on first use)
+def verify_token(id_token):
+    key = token_key(id_token)
+    cached = token_cache.get(key)
+    now = time.time()
+
+    if cached is not None:
+        claims, checked_at = cached
+        if not REVOCATION_CHECK_INTERVAL or now - checked_at < REVOCATION_CHECK_INTERVAL:
+            return claims
+        try:
+            claims = auth.verify_id_token(id_token, check_revoked=True)
+        except Exception:
+            token_cache.delete(key)
+            raise
+        _remember(key, claims, now)
+        return claims
+
+    claims = auth.verify_id_token(id_token, check_revoked=REVOCATION_CHECK_INTERVAL > 0)
+    _remember(key, claims, now)
+    return claims
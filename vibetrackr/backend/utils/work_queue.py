@@ -0,0 +1,75 @@
+import threading
+import time
+import queue
+import logging
+import traceback
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+
+#local background work queue: fixed worker threads, retries with exponential backoff, dead-letter list
+class WorkQueue:
+
+    def __init__(self, workers=4, retries=3, backoff=1.0, max_backoff=60.0, dead_letter_size=1000, name="work"):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = name
+
+        self.dead_letters = deque(maxlen=dead_letter_size)
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    #threads start with the first job so importing the app stays cheap
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    #on_failure(exc, *args, **kwargs) runs once the job lands in the dead-letter list
+    def submit(self, fn, *args, on_failure=None, **kwargs):
+        self._start()
+        self._queue.put({"fn": fn, "args": args, "kwargs": kwargs, "attempt": 0, "on_failure": on_failure})
+
+    def _retry_later(self, job):
+        delay = min(self.backoff * (2 ** (job["attempt"] - 1)), self.max_backoff)
+        timer = threading.Timer(delay, self._queue.put, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job["fn"](*job["args"], **job["kwargs"])
+            except Exception as e:
+                job["attempt"] += 1
+                if job["attempt"] <= self.retries:
+                    logger.warning("%s job %s failed (attempt %d), retrying: %s", self.name, job["fn"].__name__, job["attempt"], e)
+                    self._retry_later(job)
+                else:
+                    logger.error("%s job %s dead-lettered: %s", self.name, job["fn"].__name__, e)
+                    self.dead_letters.append({"fn": job["fn"].__name__,
+                                              "args": job["args"],
+                                              "kwargs": job["kwargs"],
+                                              "error": str(e),
+                                              "traceback": traceback.format_exc(),
+                                              "failed_at": time.time()})
+                    if job["on_failure"] is not None:
+                        try:
+                            job["on_failure"](e, *job["args"], **job["kwargs"])
+                        except Exception:
+                            logger.exception("%s on_failure handler failed", self.name)
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.qsize()
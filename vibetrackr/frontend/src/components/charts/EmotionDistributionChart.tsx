@@ -15,7 +15,8 @@ export const EmotionDistributionChart: React.FC<EmotionDistributionChartProps> =
   const emotionCounts: { [key: string]: number } = {};
 
   journals.forEach((journal) => {
-    const emotion = type === 'user' ? journal.emotion : journal.analysis.Emotion;
+    const emotion = type === 'user' ? journal.emotion : journal.analysis?.Emotion;
+    if (!emotion) return; // ai analysis still pending (or failed)
     emotionCounts[emotion] = (emotionCounts[emotion] || 0) + 1;
   });
 
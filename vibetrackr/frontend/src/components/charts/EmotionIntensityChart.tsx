@@ -14,7 +14,7 @@ export const EmotionIntensityChart: React.FC<EmotionIntensityChartProps> = ({ jo
   const sortedJournals = [...journals].sort((a, b) => a.timestamp - b.timestamp);
 
   const labels = sortedJournals.map((journal) => new Date(journal.timestamp * 1000).toLocaleDateString());
-  const dataValues = sortedJournals.map((journal) => journal.analysis.Valence_Scaled_By_Mag);
+  const dataValues = sortedJournals.map((journal) => journal.analysis?.Valence_Scaled_By_Mag ?? null);
 
   const data = {
     labels: labels,
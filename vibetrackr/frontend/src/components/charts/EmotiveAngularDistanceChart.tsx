@@ -14,7 +14,7 @@ export const EmotiveAngularDistanceChart: React.FC<EmotiveAngularDistanceChartPr
   const sortedJournals = [...journals].sort((a, b) => a.timestamp - b.timestamp);
 
   const labels = sortedJournals.map((journal) => new Date(journal.timestamp * 1000).toLocaleDateString());
-  const dataValues = sortedJournals.map((journal) => journal.analysis.Emotive_Angular_Distance);
+  const dataValues = sortedJournals.map((journal) => journal.analysis?.Emotive_Angular_Distance ?? null);
 
   const data = {
     labels: labels,
@@ -2,7 +2,7 @@ import React, { useEffect, useRef, useState } from 'react';
 import Plot from 'react-plotly.js';
 import Plotly from 'plotly.js-dist-min';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
-import type { JournalEntry } from '@/types/journal';
+import { hasAnalysis, type JournalEntry } from '@/types/journal';
 
 interface VAD3DScatterPlotProps {
   journals: JournalEntry[];
@@ -36,7 +36,8 @@ export const VAD3DScatterPlot: React.FC<VAD3DScatterPlotProps> = ({
   const [isRotating, setIsRotating] = useState<boolean>(true);
 
   // Filter and sort journals
-  const filteredJournals = [...journals]
+  const filteredJournals = journals
+    .filter(hasAnalysis) // pending / failed analyses have no point to plot
     .filter((j) => selectedEmotion === 'all' || j.emotion.toLowerCase() === selectedEmotion)
     .sort((a, b) => b.timestamp - a.timestamp)
     .slice(0, numJournalsToShow);
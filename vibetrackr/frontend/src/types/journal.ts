@@ -1,3 +1,12 @@
+export interface JournalAnalysis {
+    A: number; // Arousal
+    D: number; // Dominance
+    V: number; // Valence
+    Emotion: string; // vad-bert on hf detects this!!
+    Emotive_Angular_Distance: number;
+    Valence_Scaled_By_Mag: number;
+  }
+
 export interface JournalEntry {
     journalId: string;
     title: string;
@@ -7,12 +16,11 @@ export interface JournalEntry {
     emoji: string;
     emotion: string; // User-selected primary emotion
   
-    analysis: {
-      A: number; // Arousal
-      D: number; // Dominance
-      V: number; // Valence
-      Emotion: string; // vad-bert on hf detects this!!
-      Emotive_Angular_Distance: number;
-      Valence_Scaled_By_Mag: number;
-    };
-  }
\ No newline at end of file
+    analysis: JournalAnalysis | null; // null while the analysis is pending or after it failed
+    analysisStatus?: 'pending' | 'failed';
+  }
+
+export type AnalyzedJournalEntry = JournalEntry & { analysis: JournalAnalysis };
+
+export const hasAnalysis = (journal: JournalEntry): journal is AnalyzedJournalEntry =>
+    journal.analysis !== null && typeof journal.analysis === 'object';